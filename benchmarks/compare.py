@@ -0,0 +1,30 @@
+"""
+Compares two result files of the benchmarks, step by step and size by size.
+
+usage: python benchmarks/compare.py baseline.json candidate.json
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+
+
+def load(filepath):
+    with open(filepath, 'r') as fp:
+        data = json.load(fp)
+    return dict(((r['step'], r['points'], r['stages']), r) for r in data['results'])
+
+
+if __name__ == "__main__":
+    baseline = load(sys.argv[1])
+    candidate = load(sys.argv[2])
+
+    print('{:<28}{:>8}{:>8}{:>12}{:>12}{:>9}{:>12}{:>12}'.format(
+        'step', 'points', 'stages', 'base [s]', 'new [s]', 'speed-up', 'base [MB]', 'new [MB]'))
+    for key in sorted(set(baseline) & set(candidate)):
+        b = baseline[key]
+        c = candidate[key]
+        print('{:<28}{:>8}{:>8}{:>12.4f}{:>12.4f}{:>8.1f}x{:>12.1f}{:>12.1f}'.format(
+            key[0], key[1], key[2], b['seconds'], c['seconds'], b['seconds'] / max(c['seconds'], 1e-9),
+            b['peak_mb'], c['peak_mb']))
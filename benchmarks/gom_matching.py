@@ -0,0 +1,65 @@
+"""
+Timing comparison between the brute-force matching of points clouds (one compas
+closest_point_in_cloud call per point and per stage) and the KD-tree matching
+used by compas_testing.gom.find_points_from_stage.
+
+usage: python benchmarks/gom_matching.py [num_points] [num_stages] [workers]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from compas.geometry import closest_point_in_cloud
+
+import compas_testing.gom as gom
+
+from synthetic import synthetic_points_clouds
+
+
+def brute_force_from_stage(points_clouds, num_stages, start_stage=0, tolerance=50):
+    """The matching loop as it was before the KD-tree engine."""
+    points_history = {}
+    for p in points_clouds[start_stage]:
+        matches = []
+        for s in range(num_stages - start_stage):
+            if not s in points_clouds.keys():
+                continue
+            if s + 1 not in points_clouds.keys():
+                cpc = closest_point_in_cloud(p, points_clouds[start_stage + s + 2])
+            else:
+                cpc = closest_point_in_cloud(p, points_clouds[start_stage + s + 1])
+            if cpc[0] > tolerance and s < 122:
+                matches.append((0.0, (0.0, 0.0, 0.0), 0.0))
+            else:
+                matches.append(cpc)
+        points_history[str(p)] = matches
+    return points_history
+
+
+if __name__ == "__main__":
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    num_stages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    points_clouds = synthetic_points_clouds(num_points, num_stages + 1)
+
+    t0 = time.perf_counter()
+    brute = brute_force_from_stage(points_clouds, num_stages)
+    t1 = time.perf_counter()
+    kdtree = gom.find_points_from_stage(points_clouds, num_stages)
+    t2 = time.perf_counter()
+    if workers:
+        parallel = gom.find_points_from_stage(points_clouds, num_stages, workers=workers)
+        t3 = time.perf_counter()
+
+    same = all([m[2] for m in brute[k]] == [m[2] for m in kdtree[k]] for k in brute)
+    print('points: {}  stages: {}'.format(num_points, num_stages))
+    print('brute force : {:.3f} s'.format(t1 - t0))
+    print('kd-tree     : {:.3f} s'.format(t2 - t1))
+    print('speed-up    : {:.1f}x'.format((t1 - t0) / max(t2 - t1, 1e-9)))
+    if workers:
+        print('kd-tree, {} workers: {:.3f} s'.format(workers, t3 - t2))
+        same = same and dict(parallel) == dict(kdtree)
+    print('identical matches: {}'.format(same))
@@ -0,0 +1,139 @@
+"""
+Benchmark of the GOM pipeline of examples/GOM: convert -> clean -> evaluate,
+on synthetic exports of increasing size. Every step is timed and its peak memory
+is measured with tracemalloc. The results are saved as a json file so that runs
+can be compared over time with benchmarks/compare.py.
+
+usage: python benchmarks/gom_pipeline.py --points 100 1000 --stages 20 100 --dropout 0.01
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+import numpy as np
+
+import compas_testing.gom as gom
+from compas_testing.helpers import normalise_dict
+
+from synthetic import write_synthetic_export
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(HERE, 'results')
+
+
+def measure(step, function, *args, **kwargs):
+    """
+    Runs a step of the pipeline and measures its duration and peak memory.
+    """
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {'step': step, 'seconds': seconds, 'peak_mb': peak / 1e6}
+
+
+def run_pipeline(folder, num_points, num_stages, noise, dropout, drift, tolerance, workers):
+    """
+    Runs the pipeline on one synthetic export and returns the measures of every step.
+    """
+
+    export = os.path.join(folder, 'export.txt')
+    write_synthetic_export(export, num_points, num_stages, noise, dropout, drift)
+
+    measures = []
+
+    def step(name, function, *args, **kwargs):
+        result, m = measure(name, function, *args, **kwargs)
+        measures.append(m)
+        return result
+
+    results = step('results_to_list', gom.results_to_list, export)
+    step('results_to_array', gom.results_to_array, export)
+    clouds = step('group_per_stage', gom.group_per_stage, results)
+    del results
+    history = step('find_points_from_stage', gom.find_points_from_stage,
+                   clouds, len(clouds) - 1, tolerance=tolerance, workers=workers)
+
+    # the history is cleaned and split directly, the removed points and the cycles are views on it
+    corrupted = step('find_corrupted_points', gom.find_corrupted_points, history)
+    step('find_corrupted_stages', gom.find_corrupted_stages, history)
+    clean = step('remove_points_from_results', gom.remove_points_from_results, corrupted, history)
+    half = (num_stages - 1) // 2
+    step('split_results', gom.split_results, clean, {'c0': [0, half], 'c1': [half, num_stages - 1]})
+
+    step('evaluate_displacements', gom.evaluate_displacements, clean)
+    distances = step('to_distances_dict', clean.to_distances_dict)
+    normalised = step('normalise_dict', normalise_dict, distances, 'max')
+    step('evaluate_color_map', gom.evaluate_color_map, normalised)
+    step('history_to_json', gom.history_to_json, history, folder,
+         names=['complete', 'coordinates', 'distances'], from_gom=True)
+    step('history_to_json_compact', gom.history_to_json, history, folder,
+         names=['complete', 'coordinates', 'distances'], from_gom=True, compact=True, precision=3)
+
+    for m in measures:
+        m.update({'points': num_points, 'stages': num_stages})
+    return measures
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--stages', type=int, nargs='+', default=[20, 60])
+    parser.add_argument('--noise', type=float, default=0.5)
+    parser.add_argument('--dropout', type=float, default=0.01)
+    parser.add_argument('--drift', type=float, nargs=3, default=[0.05, 0.0, 0.0])
+    parser.add_argument('--tolerance', type=float, default=50)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None, help='json file of the results, default in benchmarks/results')
+    args = parser.parse_args()
+
+    runs = []
+    folder = tempfile.mkdtemp()
+    try:
+        for num_stages in args.stages:
+            for num_points in args.points:
+                measures = run_pipeline(folder, num_points, num_stages, args.noise, args.dropout, args.drift,
+                                        args.tolerance, args.workers)
+                row = '{points:>7} pts {stages:>5} stages  {step:<28}{seconds:>10.4f} s {peak_mb:>10.1f} MB'
+                for m in measures:
+                    print(row.format(**m))
+                runs.extend(measures)
+    finally:
+        shutil.rmtree(folder)
+
+    output = args.output
+    if output is None:
+        if not os.path.exists(RESULTS):
+            os.makedirs(RESULTS)
+        output = os.path.join(RESULTS, 'gom_pipeline_{}.json'.format(time.strftime('%Y%m%d_%H%M%S')))
+    with open(output, 'w') as fp:
+        json.dump({'environment': environment(), 'parameters': vars(args), 'results': runs}, fp, indent=1)
+    print('results saved in {}'.format(output), file=sys.stderr)
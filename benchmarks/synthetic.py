@@ -0,0 +1,79 @@
+"""
+Synthetic GOM PONTOS data for the benchmarks: markers on a plate, measured through
+successive stages with noise, dropouts and a rigid drift of the whole specimen.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+
+def synthetic_markers(num_points, num_stages, noise=0.5, dropout=0.0, drift=(0.0, 0.0, 0.0), seed=0):
+    """
+    Generates the markers locations at each stage.
+
+    Parameters
+    ----------
+    num_points : int - number of markers
+    num_stages : int - number of stages
+    noise : float - standard deviation of the measurement noise [mm]
+    dropout : float - probability that a marker is missing in a stage
+    drift : [X, Y, Z] - rigid translation of the specimen per stage [mm]
+    seed : int - seed of the random generator
+
+    Returns
+    -------
+    reference : array (points x 3) - markers locations before the test
+    stages : list of arrays - markers locations at each stage, shuffled, without the missing markers
+    ids : list of arrays - index of the markers of each stage in the reference
+    """
+
+    rng = np.random.RandomState(seed)
+    # markers on a regular grid, so that they are well separated like on a real specimen
+    side = int(np.ceil(np.sqrt(num_points)))
+    spacing = 2000.0 / side
+    grid = np.indices((side, side)).reshape(2, -1).T[:num_points] * spacing
+    reference = np.column_stack((grid + rng.uniform(-0.1, 0.1, grid.shape) * spacing,
+                                 rng.uniform(-5.0, 5.0, num_points)))
+
+    stages = []
+    ids = []
+    for s in range(num_stages):
+        cloud = reference + s * np.asarray(drift, dtype=float) + rng.normal(0.0, noise, reference.shape)
+        kept = np.flatnonzero(rng.uniform(size=num_points) >= dropout) if s else np.arange(num_points)
+        kept = kept[rng.permutation(len(kept))]
+        stages.append(cloud[kept])
+        ids.append(kept)
+    return reference, stages, ids
+
+
+def synthetic_points_clouds(num_points, num_stages, noise=0.5, dropout=0.0, drift=(0.0, 0.0, 0.0), seed=0):
+    """
+    Generates the points clouds dictionary, as returned by gom.group_per_stage.
+    """
+
+    _, stages, _ = synthetic_markers(num_points, num_stages, noise, dropout, drift, seed)
+    return dict((s, [tuple(p) for p in cloud.tolist()]) for s, cloud in enumerate(stages))
+
+
+def write_synthetic_export(filepath, num_points, num_stages, noise=0.5, dropout=0.0, drift=(0.0, 0.0, 0.0),
+                           seed=0, stage_time=0.5):
+    """
+    Writes a synthetic export with the layout of the GOM PONTOS results:
+    Stage | Stage time | ID/Name | X | Y | Z | dX | dY | dZ | d
+    """
+
+    reference, stages, ids = synthetic_markers(num_points, num_stages, noise, dropout, drift, seed)
+    row = 'Stage {}\t{:.3f}\tM{}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\n'
+    with open(filepath, 'w') as f:
+        for s, (cloud, kept) in enumerate(zip(stages, ids)):
+            delta = cloud - reference[kept]
+            d = np.linalg.norm(delta, axis=1)
+            f.writelines(row.format(s, s * stage_time, i, x, y, z, dx, dy, dz, dd)
+                         for i, (x, y, z), (dx, dy, dz), dd in zip(kept.tolist(), cloud.tolist(),
+                                                                   delta.tolist(), d.tolist()))
+
+
+if __name__ == "__main__":
+    import sys
+    write_synthetic_export(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
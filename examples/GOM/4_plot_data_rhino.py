@@ -15,9 +15,9 @@ DATA = os.path.abspath(os.path.join(HOME, "data"))
 DOCS = os.path.abspath(os.path.join(HOME, "docs"))
 TEMP = os.path.abspath(os.path.join(HOME, "temp"))
 
-# set point coordinates json files location and read the data
+# set point coordinates json files location and read the data of the stages to draw
 input_file = DATA + '/GOM_output/points_history_c1_coord.json'
-coordinates_data = read_json(input_file)
+coordinates_data = read_json(input_file, stages=[0, 55])
 
 input_file = DATA + '/GOM_output/points_history_c1_dist.json'
 distances_data = read_json(input_file)
@@ -5,6 +5,18 @@ compas_testing.gom
 
 .. currentmodule:: compas_testing.gom
 
+Data Structures
+===============
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+
+    PointsHistory
+    PointsHistoryView
+    StageMatches
+    PointsTracker
+
 Import/Export
 =============
 
@@ -12,13 +24,44 @@ Import/Export
     :toctree: generated/
     :nosignatures:
 
+    results_to_array
     results_to_list
+    iter_stages
+    follow_stages
     group_per_stage
     group_per_gkey
     find_points_between_stages
     find_points_from_stage
     history_to_json
 
+Storage
+=======
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+
+    history_to_binary
+    history_from_binary
+    read_binary_header
+    history_to_parquet
+    read_parquet_history
+    history_from_parquet
+    history_to_container
+    HistoryContainer
+
+Matching
+========
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+
+    SpatialHash
+    closest_points_in_cloud
+    assign_points_in_cloud
+    closest_points_in_clouds
+
 Clean Results
 =============
 
@@ -26,6 +69,7 @@ Clean Results
     :toctree: generated/
     :nosignatures:
 
+    find_corruption
     find_corrupted_stages
     find_corrupted_points
     remove_points_from_results
@@ -38,13 +82,18 @@ Evaluate Results
     :toctree: generated/
     :nosignatures:
 
+    DisplacementQuery
     find_abs_max_displacement
     evaluate_displacements
     evaluate_color_map
 
 """
 
+from .history import *
+from .match import *
+from .tracker import *
 from .convert import *
+from .store import *
 from .clean import *
 from .evaluate import *
 
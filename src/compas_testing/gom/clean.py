@@ -1,9 +1,16 @@
+from itertools import chain
+
+import numpy as np
+
+from compas_testing.gom.history import PointsHistory
+
 __author__ = 'Francesco Ranaudo'
 __copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
 __license__ = 'MIT License'
 __email__ = 'ranaudo@arch.ethz.ch'
 
-__all__ = ['find_corrupted_stages',
+__all__ = ['find_corruption',
+           'find_corrupted_stages',
            'find_corrupted_points',
            'remove_points_from_results',
            'split_results',
@@ -13,31 +20,80 @@ __all__ = ['find_corrupted_stages',
 # ******************************************************************************
 #   Clean results
 # ******************************************************************************
+def _missing(coordinates_data, val=(0.0, 0.0, 0.0)):
+    """
+    Returns the array of bool (points x stages) of the missing points, True where the point was not found.
+    """
+
+    if isinstance(coordinates_data, PointsHistory):
+        return ~coordinates_data.mask
+
+    values = list(coordinates_data.values())
+    if not values:
+        return np.zeros((0, 0), dtype=bool)
+    num_stages = len(values[0])
+    try:
+        marker = np.asarray(val, dtype=np.float64).ravel()
+        if marker.size == 1 and num_stages and not hasattr(values[0][0], '__len__'):
+            # scalar entries, e.g. distances
+            return np.array(values, dtype=np.float64).reshape(len(values), -1) == marker[0]
+        if all(len(value) == num_stages for value in values) and (not num_stages or len(values[0][0]) == marker.size):
+            # flat read of the coordinates, much faster than building the nested array
+            coordinates = np.fromiter(chain.from_iterable(chain.from_iterable(values)), dtype=np.float64,
+                                      count=len(values) * num_stages * marker.size)
+            return np.all(coordinates.reshape(len(values), num_stages, marker.size) == marker, axis=2)
+    except (TypeError, ValueError):
+        pass
+    # entries that are not coordinates, e.g. the tuples of a points history
+    return np.array([[e == val for e in value] for value in values], dtype=bool).reshape(len(values), -1)
+
+
+def find_corruption(coordinates_data, val=(0.0, 0.0, 0.0)):
+    """
+    Finds the missing points of the results in a single pass over the array of missing points.
+
+    Parameters
+    ----------
+    coordinates_data : dictionary or PointsHistory
+        key: string - the coordinates of a point in initial stage
+        value : sequence - a sequence of locations of a given point in three-dimensional space
+    val: any marker used to identify missing points, a PointsHistory uses its mask instead
+
+    Returns
+    -------
+    stages : array of int - indexes of the stages containing missing points
+    points : array of int - indexes of the points missing in at least one stage, in the order of the keys
+    stage_counts : array of int - number of missing points in each stage
+    point_counts : array of int - number of stages in which each point is missing
+
+    """
+
+    missing = _missing(coordinates_data, val)
+    stage_counts = np.count_nonzero(missing, axis=0)
+    point_counts = np.count_nonzero(missing, axis=1)
+    return np.flatnonzero(stage_counts), np.flatnonzero(point_counts), stage_counts, point_counts
+
+
 def find_corrupted_stages(coordinates_data, val=(0.0, 0.0, 0.0)):
     """
     Find the index of the stages with blank points and add them to a list.
 
     Parameters
     ----------
-    coordinates_data : dictionary
+    coordinates_data : dictionary or PointsHistory
         key: string - the coordinates of a point in initial stage
         value : sequence - a sequence of tuples describing locations of a given point in three-dimensional space
         * tuple : distance to reference point, XYZ coordinates of the point, Stage of the point
-    val: any marker used to identify missing points
+    val: any marker used to identify missing points, a PointsHistory uses its mask instead
 
     Returns
     -------
-    index_list : list - a list with the indexes of the stages containing blank points
+    index_list : list - a sorted list with the indexes of the stages containing blank points
 
     """
-    index_list = []
-    for key, value in coordinates_data.items():
-        for i, e in enumerate(value):
-            if e == val:
-                index_list.append(i)
-    # remove duplicates (dict cannot have duplicate keys!)
-    index_list = list(dict.fromkeys(index_list))
-    return index_list
+
+    stages = find_corruption(coordinates_data, val)[0]
+    return stages.tolist()
 
 
 def find_corrupted_points(coordinates_data, val=(0.0, 0.0, 0.0)):
@@ -46,11 +102,11 @@ def find_corrupted_points(coordinates_data, val=(0.0, 0.0, 0.0)):
 
     Parameters
     ----------
-    coordinates_data : dictionary
+    coordinates_data : dictionary or PointsHistory
         key: string - the coordinates of a point in initial stage
         value : sequence - a sequence of tuples describing locations of a given point in three-dimensional space
         * tuple : distance to reference point, XYZ coordinates of the point, Stage of the point
-    val: any marker used to identify missing points
+    val: any marker used to identify missing points, a PointsHistory uses its mask instead
 
     Returns
     -------
@@ -58,37 +114,35 @@ def find_corrupted_points(coordinates_data, val=(0.0, 0.0, 0.0)):
 
     """
 
-    corrupted_points_keys = []
-    for key, value in coordinates_data.items():
-        try:
-            value.index(val)
-            corrupted_points_keys.append(key)
-        except ValueError:
-            pass
-
-    return corrupted_points_keys
+    points = find_corruption(coordinates_data, val)[1]
+    keys = coordinates_data.point_keys if isinstance(coordinates_data, PointsHistory) else list(coordinates_data)
+    return [keys[i] for i in points.tolist()]
 
 
 def remove_points_from_results(point_keys, points_history):
     """
     Remove a list of points form the results. This deletes the entire history
-    of that point.
+    of that point. The input results are not modified.
 
     Parameters
     ----------
     point_keys : list - list of the keys of the points to be removed
 
-    points_history : dict - points results
+    points_history : dict or PointsHistory - points results
 
     Returns
     -------
-    points_history : dict - clean results
+    points_history : dict or PointsHistoryView - clean results, a new dictionary sharing the values of the input,
+        or a view on the input history that only stores the mask of the remaining points
 
     """
+    if isinstance(points_history, PointsHistory):
+        keep = np.ones(points_history.num_points, dtype=bool)
+        keep[points_history._rows(point_keys).astype(np.int64)] = False
+        return points_history.view_points(keep)
 
-    for k in point_keys:
-        del points_history[k]
-    return points_history
+    removed = set(point_keys)
+    return dict((k, v) for k, v in points_history.items() if k not in removed)
 
 
 def split_results(points_history, chunks):
@@ -98,7 +152,7 @@ def split_results(points_history, chunks):
 
     Parameters
     ----------
-    points_history : dict
+    points_history : dict or PointsHistory
         key: str - point
         value : list - point history
 
@@ -108,9 +162,12 @@ def split_results(points_history, chunks):
 
     Returns
     -------
-    cycles : dict of dict
+    cycles : dict of dict, or dict of PointsHistoryView - the views only store the stage range of the chunk
 
     """
+    if isinstance(points_history, PointsHistory):
+        return dict((c, points_history.view_stages(ends[0], ends[-1])) for c, ends in chunks.items())
+
     cycles = {}
     for c, ends in chunks.items():
         new_history = {}
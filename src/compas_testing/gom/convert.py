@@ -1,18 +1,30 @@
 # -*- coding: utf-8 -*-
 
+import io
+import os
+import gzip
 import json
+import time
 import itertools
 
-from compas.geometry import closest_point_in_cloud
+import numpy as np
+import pandas as pd
 
-from compas_testing.helpers import base_round
+from compas_testing.gom.match import SpatialHash
+from compas_testing.gom.match import closest_points_in_clouds
+from compas_testing.gom.history import BLANK
+from compas_testing.gom.history import StageMatches
+from compas_testing.gom.history import PointsHistory
 
 __author__ = 'Francesco Ranaudo'
 __copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
 __license__ = 'MIT License'
 __email__ = 'ranaudo@arch.ethz.ch'
 
-__all__ = ['results_to_list',
+__all__ = ['results_to_array',
+           'results_to_list',
+           'iter_stages',
+           'follow_stages',
            'group_per_stage',
            'group_per_gkey',
            'find_points_between_stages',
@@ -21,6 +33,11 @@ __all__ = ['results_to_list',
            ]
 
 
+# default distance (in mm) within which the points of different stages are the same marker,
+# shared by the geometric keys of results_to_list and the groups of group_per_gkey
+GKEY_TOLERANCE = 50
+
+
 # def parse_results(input_file):
 #     results=[]
 #     with open(input_file,'r') as f:
@@ -42,9 +59,85 @@ __all__ = ['results_to_list',
 #   IN
 # ******************************************************************************
 
-def results_to_list(input_file, tolerance=50):
+def _results_dtype(id_dtype):
+    """
+    Builds the dtype of the structured array describing the GOM PONTOS results.
+    """
+
+    return np.dtype([('stage', np.int32),
+                     ('time', np.float64),
+                     ('id', id_dtype),
+                     ('xyz', np.float64, (3,)),
+                     ('dxyz', np.float64, (3,)),
+                     ('d', np.float64),
+                     ])
+
+
+def _table_to_array(table):
+    """
+    Converts a table parsed from the GOM PONTOS export into a structured array.
+
+    Parameters
+    ----------
+    table : pandas DataFrame - columns 1 to 10 of the export
+
+    Returns
+    -------
+    results : structured array - see results_to_array
+    """
+
+    ids = table[3].to_numpy().astype(str)
+    results = np.empty(len(table), dtype=_results_dtype(ids.dtype))
+    results['stage'] = table[1].to_numpy()
+    results['time'] = table[2].to_numpy()
+    results['id'] = ids
+    results['xyz'] = table[[4, 5, 6]].to_numpy(dtype=np.float64)
+    results['dxyz'] = table[[7, 8, 9]].to_numpy(dtype=np.float64)
+    results['d'] = table[10].to_numpy(dtype=np.float64)
+    return results
+
+
+def _read_table(input_file, **kwargs):
+    """
+    Reads the whitespace separated GOM PONTOS export with the pandas C parser.
+    The first column is skipped, as in the original line by line reader.
+    """
+
+    return pd.read_csv(input_file,
+                       sep=r'\s+',
+                       header=None,
+                       names=range(11),
+                       usecols=range(1, 11),
+                       dtype={1: np.float64, 2: np.float64, 3: str},
+                       engine='c',
+                       **kwargs)
+
+
+def results_to_array(input_file):
+    """
+    Parses the text results in a single pass into a structured array with typed columns.
+
+    Parameters
+    ----------
+    input_file : .txt file
+        File containing the data exported from GOM PONTOS.
+        Each row describes the points in successive stages as follows :
+        Stage | Stage time | ID/Name | X | Y | Z | dX | dY | dZ | d
+
+    Returns
+    -------
+    results : structured array
+        one record per point and stage with the fields :
+        stage (int), time (float), id (str), xyz (3 floats), dxyz (3 floats), d (float)
+    """
+
+    return _table_to_array(_read_table(input_file))
+
+
+def results_to_list(input_file, tolerance=GKEY_TOLERANCE):
     """
     Converts the text results to a list and computes the geometric keys of the points within a specific tolerance.
+    The file is parsed with results_to_array, this function only adapts the records to the list format.
 
     Parameters
     ----------
@@ -61,19 +154,145 @@ def results_to_list(input_file, tolerance=50):
         each list describes a point at a given stage as follows : [Stage, time, X, Y, Z, gkey]
     """
 
-    results = []
-    with open(input_file, 'r') as f:
-        for line in f:
-            elem = line.split()
-            sl = elem[1:3] + elem[4:7]
-            fl = list(float(sl[i]) for i in range(len(sl)))
-            # add geometric key
-            fl.append(str(base_round(fl[2], base=tolerance)) +
-                      str(base_round(fl[3], base=tolerance)) +
-                      str(base_round(fl[4], base=tolerance)))
-            results.append(fl)
+    results = results_to_array(input_file)
+    stages = results['stage'].astype(np.float64).tolist()
+    times = results['time'].tolist()
+    xyz = results['xyz'].tolist()
+    # geometric key, same rounding as base_round
+    rounded = np.round(results['xyz'] / tolerance).astype(np.int64).tolist()
 
-    return results
+    results_list = []
+    for stage, t, (x, y, z), (i, j, k) in zip(stages, times, xyz, rounded):
+        gkey = str(tolerance * i) + str(tolerance * j) + str(tolerance * k)
+        results_list.append([stage, t, x, y, z, gkey])
+
+    return results_list
+
+
+def _group_to_stage(group):
+    return int(group['stage'][0]), float(group['time'][0]), [tuple(p) for p in group['xyz'].tolist()]
+
+
+def iter_stages(input_file, chunksize=100000):
+    """
+    Reads the text results one stage at a time.
+    The file is parsed in chunks of rows and only the stage being completed is kept in memory,
+    therefore the rows of the export must be ordered by stage.
+
+    Parameters
+    ----------
+    input_file : .txt file
+        File containing the data exported from GOM PONTOS.
+        Each row describes the points in successive stages as follows :
+        Stage | Stage time | ID/Name | X | Y | Z | dX | dY | dZ | d
+
+    chunksize : int - number of rows parsed at once
+
+    Yields
+    ------
+    tuple : (stage, time, cloud)
+        stage : int - Stage number
+        time : float - Stage time
+        cloud : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z]
+    """
+
+    pending = None
+    for table in _read_table(input_file, chunksize=chunksize):
+        results = _table_to_array(table)
+        if pending is not None:
+            dtype = _results_dtype(np.promote_types(pending['id'].dtype, results['id'].dtype))
+            results = np.concatenate((pending.astype(dtype), results.astype(dtype)))
+        bounds = np.flatnonzero(np.diff(results['stage'])) + 1
+        groups = np.split(results, bounds)
+        for group in groups[:-1]:
+            yield _group_to_stage(group)
+        pending = groups[-1]
+
+    if pending is not None and len(pending):
+        yield _group_to_stage(pending)
+
+
+def _read_checkpoint(checkpoint, input_file):
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint, 'r') as fp:
+        state = json.load(fp)
+    if os.path.abspath(state['file']) != os.path.abspath(input_file):
+        raise ValueError('the checkpoint {} belongs to another export: {}'.format(checkpoint, state['file']))
+    return state['offset']
+
+
+def _write_checkpoint(checkpoint, input_file, offset):
+    if checkpoint is None:
+        return
+    with open(checkpoint + '.tmp', 'w') as fp:
+        json.dump({'file': os.path.abspath(input_file), 'offset': offset}, fp)
+    os.replace(checkpoint + '.tmp', checkpoint)
+
+
+def follow_stages(input_file, checkpoint=None, interval=1.0, timeout=None):
+    """
+    Follows a GOM PONTOS export while the acquisition is appending stages to it.
+    Only the bytes appended since the last read are parsed, and a stage is yielded as soon as
+    the first row of the next stage is written. The offset of the first row of the stage being written
+    is saved in the checkpoint file after each yielded stage, so a restart resumes from there.
+
+    Parameters
+    ----------
+    input_file : .txt file
+        File containing the data exported from GOM PONTOS, ordered by stage.
+        Each row describes the points in successive stages as follows :
+        Stage | Stage time | ID/Name | X | Y | Z | dX | dY | dZ | d
+
+    checkpoint : str, optional - path of the json file storing the offset, None to always start from the beginning,
+        a checkpoint written for another export raises a ValueError
+
+    interval : float - seconds to wait before looking for new data
+
+    timeout : float, optional - seconds without new data after which the last stage is yielded
+        and the function returns, None to follow the file forever
+
+    Yields
+    ------
+    tuple : (stage, time, cloud) - see iter_stages
+    """
+
+    offset = _read_checkpoint(checkpoint, input_file)
+    pending = b''  # complete lines of the stage being written, starting at offset
+    idle = 0.0
+    with open(input_file, 'rb') as f:
+        while True:
+            f.seek(offset + len(pending))
+            data = f.read(1 << 23)
+            end = data.rfind(b'\n') + 1
+            if not end:
+                if timeout is not None and idle >= timeout:
+                    break
+                time.sleep(interval)
+                idle += interval
+                continue
+            idle = 0.0
+            pending += data[:end]
+
+            lines = pending.splitlines(True)
+            starts = list(itertools.accumulate([0] + [len(line) for line in lines[:-1]]))
+            starts = [start for start, line in zip(starts, lines) if line.strip()]
+            if not starts:
+                continue
+            results = _table_to_array(_read_table(io.BytesIO(pending)))
+            bounds = np.flatnonzero(np.diff(results['stage'])) + 1
+            groups = np.split(results, bounds)
+            for group, bound in zip(groups[:-1], bounds.tolist()):
+                yield _group_to_stage(group)
+                _write_checkpoint(checkpoint, input_file, offset + starts[bound])
+            if len(bounds):
+                cut = starts[bounds[-1]]
+                offset += cut
+                pending = pending[cut:]
+
+    # the last stage is not checkpointed, a restart reads it again in case the acquisition resumes
+    if pending.strip():
+        yield _group_to_stage(_table_to_array(_read_table(io.BytesIO(pending))))
 
 
 def group_per_stage(results_list):
@@ -83,8 +302,9 @@ def group_per_stage(results_list):
 
     Parameters
     ----------
-    results_list : a list of lists
+    results_list : a list of lists or a structured array
         each list describes a point at a given stage as follows : [Stage, time, X, Y, Z, gkey]
+        the structured array is the output of results_to_array
 
     Returns
     -------
@@ -94,6 +314,13 @@ def group_per_stage(results_list):
     """
 
     results_dict = {}
+    if isinstance(results_list, np.ndarray):
+        bounds = np.flatnonzero(np.diff(results_list['stage'])) + 1
+        for group in np.split(results_list, bounds):
+            if len(group):
+                results_dict[int(group['stage'][0])] = [tuple(p) for p in group['xyz'].tolist()]
+        return results_dict
+
     for key, group in itertools.groupby(results_list, key=lambda element: element[0]):
         g = list(group)
         t = []
@@ -104,39 +331,61 @@ def group_per_stage(results_list):
     return results_dict
 
 
-def group_per_gkey(results_list):
+def group_per_gkey(results_list, tolerance=GKEY_TOLERANCE):
     """
     Groups the results in a dictionary where the keys are the geometric keys and the values
     are the point coordinates at each stage.
+    The points are grouped in a single pass with a hash grid (see SpatialHash):
+    a point joins the closest group found within the tolerance in its cell or in the neighbouring cells,
+    otherwise it starts a new group. The rows do not need to be adjacent.
+    The gkey column of results_to_list is not used: the keys are the indices of the groups.
 
     Parameters
     ----------
-    results_list : a list of lists
+    results_list : a list of lists or a structured array
         each list describes a point at a given stage as follows : [Stage, time, X, Y, Z, gkey]
+        the structured array is the output of results_to_array
+
+    tolerance : maximum distance where to look for corresponding points, by default the same as results_to_list
 
     Returns
     -------
     dict : a dictionary
         each element in the dictionary is described as follows :
-        key : int - gkey
+        key : int - gkey, index of the group in order of appearance
         value : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z]
     """
 
+    if isinstance(results_list, np.ndarray):
+        points = [tuple(p) for p in results_list['xyz'].tolist()]
+    else:
+        points = [(e[2], e[3], e[4]) for e in results_list]
+
     results_dict = {}
-    for key, group in itertools.groupby(results_list, key=lambda element: element[5]):
-        g = list(group)
-        t = []
-        for e in g:
-            t.append((e[2], e[3], e[4]))
-        results_dict[key] = t
+    for key, point in zip(SpatialHash(tolerance).group(points), points):
+        results_dict.setdefault(key, []).append(point)
 
     return results_dict
 
 
-def find_points_between_stages(points_clouds, num_stages, tolerance=30):
+def _assignment_tolerance(mode, tolerance):
     """
-    Finds matching points in pairs of neighbouring stages using COMPAS point_in_cloud function.
-    When no matching point is found within the tolerance, blank points (0.0, (0.0, 0.0, 0.0), 0.0) are added.
+    Returns the tolerance of the one-to-one assignment for a matching mode, None for nearest points.
+    """
+
+    if mode == 'nearest':
+        return None
+    if mode == 'assignment':
+        return tolerance
+    raise ValueError("unknown matching mode: {}, use 'nearest' or 'assignment'".format(mode))
+
+
+def find_points_between_stages(points_clouds, num_stages, tolerance=30, workers=None, mode='nearest'):
+    """
+    Finds matching points in pairs of neighbouring stages using a KD-tree built on each stage cloud.
+    The points without a matching point within the tolerance are masked out, with nan coordinates and distances.
+    In 'nearest' mode two points can match the same point of the next stage,
+    in 'assignment' mode the matching is one-to-one (see assign_points_in_cloud).
 
     Parameters
     ----------
@@ -148,31 +397,45 @@ def find_points_between_stages(points_clouds, num_stages, tolerance=30):
 
     tolerance : int - max distance between two neighbouring points
 
+    workers : int, optional - number of processes used to match the stages, None to match them in this process
+
+    mode : str - 'nearest' or 'assignment'
+
     Returns
     -------
-    matches : a sequence of tuples describing locations of a given point in three-dimensional space
-    tuple – (distance to reference point, XYZ coordinates of the point, Stage of the point)
+    matches : list of StageMatches - one per pair of stages, for the points of the first stage
+        each behaves like the list of tuples (distance to the matching point, XYZ coordinates of the point,
+        index of the point in the next stage), with blank points where no match was found,
+        and holds the distances, coordinates, indices and mask arrays.
+        The matches used to be plain lists: StageMatches supports indexing, slicing, iteration and len,
+        but it is read-only and not a list, convert it with list() where a list is needed
 
     """
 
+    matches = closest_points_in_clouds([points_clouds[s] for s in range(num_stages - 1)],
+                                       [points_clouds[s + 1] for s in range(num_stages - 1)],
+                                       workers,
+                                       _assignment_tolerance(mode, tolerance))
     points_history = []
-    for s in range(num_stages - 1):
-        match = []
-        for p in points_clouds[s]:
-            cpc = closest_point_in_cloud(p, points_clouds[s + 1])
-            if cpc[0] > tolerance:  # note it is in mm
-                match.append((0.0, (0.0, 0.0, 0.0), 0.0))
-            else:
-                match.append(cpc)
-        points_history.append(match)
+    for s, (d, i) in enumerate(matches):
+        cloud = np.asarray(points_clouds[s + 1], dtype=np.float64).reshape(-1, 3)
+        found = d <= tolerance  # note it is in mm
+        distances = np.where(found, d, np.nan)
+        coordinates = np.full((len(d), 3), np.nan)
+        coordinates[found] = cloud[i[found]]
+        indices = np.where(found, i, -1)
+        points_history.append(StageMatches(distances, coordinates, indices, found))
 
     return points_history
 
 
-def find_points_from_stage(points_clouds, num_stages, start_stage=0, tolerance=50):
+def find_points_from_stage(points_clouds, num_stages, start_stage=0, tolerance=50, workers=None, mode='nearest'):
     """
-    Finds matching points between one stage and the others using compas point_in_cloud function.
-    When no matching point is found within the tolerance, blank points (0.0, (0.0, 0.0, 0.0), 0.0) are added.
+    Finds matching points between one stage and the others.
+    A KD-tree is built once per stage cloud and all the reference points are matched in a single query.
+    The points that are not found within the tolerance are masked out of the history.
+    In 'nearest' mode two reference points can match the same point of a stage,
+    in 'assignment' mode the matching is one-to-one (see assign_points_in_cloud).
 
     Parameters
     ----------
@@ -186,32 +449,49 @@ def find_points_from_stage(points_clouds, num_stages, start_stage=0, tolerance=5
 
     tolerance : int - max distance between two neighbouring points
 
+    workers : int, optional - number of processes used to match the stages, None to match them in this process
+
+    mode : str - 'nearest' or 'assignment'
+
     Returns
     -------
-    points_history : dictionary
+    points_history : PointsHistory - behaves like a dictionary where
         key: string - the coordinates of a point in initial stage
         value : sequence - a sequence of tuples describing locations of a given point in three-dimensional space
-        tuple – (distance to reference point, XYZ coordinates of the point, Stage of the point)
+        tuple – (distance to reference point, XYZ coordinates of the point, index of the point in the stage cloud)
 
     """
 
-    points_history = {}
-    for p in points_clouds[start_stage]:
-        matches = []
-        for s in range(num_stages - start_stage):
-            if not s in points_clouds.keys():
-                continue
-            if s + 1 not in points_clouds.keys():
-                cpc = closest_point_in_cloud(p, points_clouds[start_stage + s + 2])
-            else:
-                cpc = closest_point_in_cloud(p, points_clouds[start_stage + s + 1])
-            if cpc[0] > tolerance and s < 122:  # note it is in mm #TODO: change!
-                matches.append((0.0, (0.0, 0.0, 0.0), 0.0))
-            else:
-                matches.append(cpc)
-        points_history[str(p)] = matches
-
-    return points_history
+    reference = points_clouds[start_stage]
+    stages = []
+    for s in range(num_stages - start_stage):
+        if s not in points_clouds.keys():
+            continue
+        if s + 1 not in points_clouds.keys():
+            stages.append((s, start_stage + s + 2))
+        else:
+            stages.append((s, start_stage + s + 1))
+
+    num_points = len(reference)
+    coordinates = np.full((num_points, len(stages), 3), np.nan)
+    distances = np.full((num_points, len(stages)), np.nan)
+    indices = np.full((num_points, len(stages)), -1, dtype=np.int32)
+    mask = np.ones((num_points, len(stages)), dtype=bool)
+    matches = closest_points_in_clouds([reference] * len(stages),
+                                       [points_clouds[stage] for s, stage in stages],
+                                       workers,
+                                       _assignment_tolerance(mode, tolerance))
+    for n, ((s, stage), (d, i)) in enumerate(zip(stages, matches)):
+        cloud = np.asarray(points_clouds[stage], dtype=np.float64)
+        found = np.isfinite(d)
+        if s < 122:  # note it is in mm #TODO: change!
+            found &= d <= tolerance
+        coordinates[found, n] = cloud[i[found]]
+        distances[found, n] = d[found]
+        indices[found, n] = i[found]
+        mask[:, n] = found
+
+    return PointsHistory(reference, coordinates, distances, mask, indices, keys=[str(p) for p in reference])
 
 
 # ******************************************************************************
@@ -262,24 +542,111 @@ def _split_points_history(points_history):
     return points_history, points_history_coord, points_history_disp
 
 
-def history_to_json(points_history, destination, names, from_gom=False):
+def _iter_split_history(points_history, from_gom, precision=None, block=1024):
+    """
+    Iterates once over a points history and yields, for each point, its key and its values
+    in each of the output histories: complete, coordinates and distances,
+    or only the history itself if it is not split.
+    """
+
+    if isinstance(points_history, PointsHistory):
+        keys = points_history.point_keys
+        for start in range(0, points_history.num_points, block):
+            rows = slice(start, start + block)
+            mask = points_history.mask[rows]
+            coordinates = np.where(mask[:, :, None], points_history.coordinates[rows], 0.0)
+            distances = np.where(mask, points_history.distances[rows], 0.0)
+            if precision is not None:
+                coordinates = np.round(coordinates, precision)
+                distances = np.round(distances, precision)
+            for key, c, d, i, m in zip(keys[rows], coordinates.tolist(), distances.tolist(),
+                                       points_history.indices[rows].tolist(), mask.tolist()):
+                complete = [(d_, c_, i_) if m_ else BLANK for d_, c_, i_, m_ in zip(d, c, i, m)]
+                yield key, (complete, c, d)
+
+    elif from_gom:
+        for key, value in points_history.items():
+            coordinates = [tuple(el[1]) for el in value]
+            distances = [el[0] for el in value]
+            if precision is not None:
+                coordinates = np.round(coordinates, precision).tolist()
+                distances = np.round(distances, precision).tolist()
+                value = [(d, c, el[2]) for d, c, el in zip(distances, coordinates, value)]
+            yield key, (value, coordinates, distances)
+
+    else:
+        for key, value in points_history.items():
+            if precision is not None:
+                value = np.round(value, precision).tolist()
+            yield key, (value,)
+
+
+def _stream_history_to_json(points_history, paths, from_gom, compact, compress, precision):
+    """
+    Writes the output histories of history_to_json in a single pass over the points history.
+    """
+
+    separators = (',', ':') if compact else (', ', ': ')
+    files = [gzip.open(path, 'wt') if compress else open(path, 'w') for path in paths]
+    try:
+        for f in files:
+            f.write('{')
+        first = True
+        for key, values in _iter_split_history(points_history, from_gom, precision):
+            key = ('' if first else separators[0]) + json.dumps(key) + separators[1]
+            for f, value in zip(files, values):
+                f.write(key + json.dumps(value, separators=separators))
+            first = False
+        for f in files:
+            f.write('}')
+    finally:
+        for f in files:
+            f.close()
+
+
+def history_to_json(points_history, destination, names, from_gom=False, compact=False, compress=False,
+                    precision=None):
     """
     Converts the points history dictionary into json files and saves them in local directory.
+    By default each history is built in full and written with indentation. If compact, compress or precision
+    are set, all the histories are written in a single pass over the points history instead.
 
     Parameters
     ----------
-    points_history : dict
+    points_history : dict or PointsHistory
         key: string - the coordinates of a point in initial stage
         value : sequence - a sequence of tuples describing locations of a given point in three-dimensional space
         tuple – (distance to reference point, XYZ coordinates of the point, Stage of the point)
     destination : str - the path to the folder in which the file will be saved
     names = list of str - list of names for each history to convert
-    from_gom = bool - set if it is the points history coming directly from GOM PONTOS
+    from_gom = bool - set if it is the points history coming directly from GOM PONTOS,
+        it is then split into the complete, coordinates and distances histories and names needs three names.
+        A PointsHistory is always split, it needs from_gom or three names
+    compact = bool - write the json files without indentation nor spaces
+    compress = bool - write gzip compressed files (.json.gz), read_json can load them
+    precision = int, optional - number of decimals of the coordinates and distances
 
     """
 
+    split = from_gom or (isinstance(points_history, PointsHistory) and len(names) == 3)
+    if isinstance(points_history, PointsHistory) and not split:
+        raise ValueError('a PointsHistory is saved as the complete, coordinates and distances histories, '
+                         'give three names or set from_gom')
+    if len(names) < (3 if split else 1):
+        raise ValueError('{} names are needed, got {}'.format(3 if split else 1, len(names)))
+
+    if compact or compress or precision is not None:
+        paths = [destination + "/points_history_" + name + ('.json.gz' if compress else '.json')
+                 for name in names[:3 if split else 1]]
+        _stream_history_to_json(points_history, paths, from_gom, compact, compress, precision)
+        return
+
     # TODO: change and move to helpers
-    if from_gom == True:
+    if isinstance(points_history, PointsHistory):
+        points_histories = [points_history.to_dict(),
+                            points_history.to_coordinates_dict(),
+                            points_history.to_distances_dict()]
+    elif from_gom:
         points_histories = _split_points_history(points_history)
     else:
         points_histories = [points_history]
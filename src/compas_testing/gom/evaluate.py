@@ -1,8 +1,12 @@
 
+import numpy as np
+
 from compas_testing.helpers import key_to_coordinates
 from compas_testing.helpers import ratio_to_rgb
 from compas.geometry import distance_point_point
 
+from compas_testing.gom.history import PointsHistory
+
 
 __author__     = 'Francesco Ranaudo'
 __copyright__  = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
@@ -10,7 +14,8 @@ __license__    = 'MIT License'
 __email__      = 'ranaudo@arch.ethz.ch'
 
 
-__all__ = ['find_abs_max_displacement',
+__all__ = ['DisplacementQuery',
+           'find_abs_max_displacement',
            'evaluate_displacements',
            'evaluate_color_map',
            ]
@@ -20,6 +25,157 @@ __all__ = ['find_abs_max_displacement',
 #   Evaluate
 # ******************************************************************************
 
+def _top(values, k, axis=-1):
+    """
+    Indices of the k largest values along an axis, sorted in decreasing order, in O(n) + O(k log k).
+    """
+
+    n = values.shape[axis]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(values.shape[:axis % values.ndim] + (0,), dtype=np.intp)
+    if k < n:
+        top = np.argpartition(-values, k - 1, axis=axis).take(np.arange(k), axis=axis)
+    else:
+        top = np.broadcast_to(np.arange(n), values.shape).copy()
+    order = np.argsort(-np.take_along_axis(values, top, axis=axis), axis=axis, kind='stable')
+    return np.take_along_axis(top, order, axis=axis)
+
+
+class DisplacementQuery(object):
+    """
+    Queries on the absolute displacements of a set of points through the stages:
+    global maximum, points with the largest displacements, largest (point, stage) pairs,
+    per stage and per cycle. The displacements are kept in a single array, so every query
+    is a selection over the array (argpartition) without loops over points or stages.
+
+    Parameters
+    ----------
+    disp_history : dict or PointsHistory
+        key: str - point key
+        value : list - list of floats, the displacement of the point at each stage
+        a PointsHistory uses its distances, the missing points are ignored
+
+    """
+
+    def __init__(self, disp_history):
+        if isinstance(disp_history, PointsHistory):
+            self.keys = disp_history.point_keys
+            values = np.where(disp_history.mask, np.abs(disp_history.distances), -np.inf)
+        else:
+            self.keys = list(disp_history.keys())
+            rows = [disp_history[key] for key in self.keys]
+            num_stages = max([len(row) for row in rows] or [0])
+            values = np.full((len(rows), num_stages), -np.inf)
+            if all(len(row) == num_stages for row in rows):
+                values[:] = np.abs(np.array(rows, dtype=np.float64).reshape(len(rows), num_stages))
+            else:
+                for i, row in enumerate(rows):
+                    values[i, :len(row)] = np.abs(row)
+        values[np.isnan(values)] = -np.inf
+        self.values = values
+        self._keys = np.empty(len(self.keys), dtype=object)
+        self._keys[:] = self.keys
+
+    def _pairs(self, flat):
+        rows, stages = np.unravel_index(flat, self.values.shape)
+        values = self.values[rows, stages]
+        return [(self.keys[r], s, v) for r, s, v in zip(rows.tolist(), stages.tolist(), values.tolist())
+                if v != -np.inf]
+
+    def max(self):
+        """
+        Returns the absolute maximum displacement.
+
+        Returns
+        -------
+        max_key : str - key of the point corresponding to maximum displacement
+        max_stage: int - stage number where the maximum displacement occurs
+        max_val : float - absolute maximum value in the points history
+        """
+
+        pairs = self.top_pairs(1)
+        return pairs[0] if pairs else (None, None, None)
+
+    def top_pairs(self, k=10):
+        """
+        Returns the k largest displacements over all points and stages.
+
+        Parameters
+        ----------
+        k : int
+
+        Returns
+        -------
+        pairs : list of tuples (key, stage, value) - in decreasing order of displacement
+        """
+
+        return self._pairs(_top(self.values.ravel(), k))
+
+    def top_points(self, k=10):
+        """
+        Returns the k points with the largest maximum displacement.
+
+        Parameters
+        ----------
+        k : int
+
+        Returns
+        -------
+        points : list of tuples (key, stage of the maximum, value) - in decreasing order of displacement
+        """
+
+        if not self.values.size:
+            return []
+        stages = np.argmax(self.values, axis=1)
+        maxima = self.values[np.arange(len(stages)), stages]
+        rows = _top(maxima, k)
+        return self._pairs(np.ravel_multi_index((rows, stages[rows]), self.values.shape))
+
+    def top_per_stage(self, k=10):
+        """
+        Returns the k largest displacements of each stage.
+
+        Parameters
+        ----------
+        k : int
+
+        Returns
+        -------
+        keys : array of str (stages x k) - keys of the points, in decreasing order of displacement
+        values : array of float (stages x k) - their displacements, -inf if there are less than k points
+        """
+
+        rows = _top(self.values.T, k, axis=1)
+        return self._keys[rows], np.take_along_axis(self.values.T, rows, axis=1)
+
+    def top_per_cycle(self, chunks, k=10):
+        """
+        Returns the k largest displacements over the points and stages of each cycle.
+
+        Parameters
+        ----------
+        chunks : dict - the stage ranges of the cycles, as for split_results
+            key: str - cycle name
+            value : list of int - [start, stop]
+        k : int
+
+        Returns
+        -------
+        cycles : dict
+            key: str - cycle name
+            value : list of tuples (key, stage, value) - in decreasing order of displacement
+        """
+
+        cycles = {}
+        for name, ends in chunks.items():
+            values = self.values[:, ends[0]:ends[-1]]
+            rows, stages = np.unravel_index(_top(values.ravel(), k), values.shape)
+            flat = np.ravel_multi_index((rows, stages + ends[0]), self.values.shape)
+            cycles[name] = self._pairs(flat)
+        return cycles
+
+
 def find_abs_max_displacement(disp_history):
 
     """
@@ -27,7 +183,7 @@ def find_abs_max_displacement(disp_history):
 
     Parameters
     ----------
-    disp_history : dict
+    disp_history : dict or PointsHistory
         key: str - point key
         value : list - list of floats
 
@@ -39,11 +195,7 @@ def find_abs_max_displacement(disp_history):
 
     """
 
-    max_key = max(disp_history)
-    max_val = max(disp_history[max_key])
-    max_stage = disp_history[max_key].index(max_val)
-
-    return max_key, max_stage, max_val
+    return DisplacementQuery(disp_history).max()
 
 
 def evaluate_displacements(points_history):
@@ -55,7 +207,7 @@ def evaluate_displacements(points_history):
 
     Parameters
     ----------
-    points_history : dictionary
+    points_history : dictionary or PointsHistory
         key: str - the coordinates of a point in initial stage
         value : sequence - a sequence of tuples describing locations of a given point in three-dimensional space
         * tuple : distance to reference point, XYZ coordinates of the point, Stage of the point
@@ -65,8 +217,14 @@ def evaluate_displacements(points_history):
     points_history_disp : dictionary
         key: str - the coordinates of a point in initial stage
         value : list - a list of distances between the reference point and its location for every stage.
+        for a PointsHistory the distances are recomputed from its coordinates, 0.0 where the point was not found
 
     """
+    if isinstance(points_history, PointsHistory):
+        distances = np.linalg.norm(points_history.coordinates - points_history.reference[:, None, :], axis=2)
+        distances = np.where(points_history.mask, distances, 0.0)
+        return dict(zip(points_history.point_keys, distances.tolist()))
+
     points_history_disp = {}
     for key, value in points_history.items():
         ref_point = key_to_coordinates(key)
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from collections.abc import Mapping
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Mapping
+    from collections import Sequence
+
+import numpy as np
+
+from compas_testing.helpers import key_to_coordinates
+
+__author__ = 'Francesco Ranaudo'
+__copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
+__license__ = 'MIT License'
+__email__ = 'ranaudo@arch.ethz.ch'
+
+__all__ = ['PointsHistory',
+           'PointsHistoryView',
+           'StageMatches',
+           ]
+
+
+BLANK = (0.0, (0.0, 0.0, 0.0), 0.0)
+
+
+# ******************************************************************************
+#   Points history
+# ******************************************************************************
+
+class PointsHistory(Mapping):
+    """
+    Array-backed history of the locations of a set of points through successive stages.
+    It behaves like the points history dictionary: the keys are the coordinates of the points
+    in the reference stage and the values are sequences of tuples
+    (distance to reference point, XYZ coordinates of the point, index of the point in the stage cloud),
+    with blank points (0.0, (0.0, 0.0, 0.0), 0.0) where the point was not found.
+    The missing points are stored in a mask, the arrays hold nan (and -1 for the indices) where the mask is False,
+    so a point found at the origin is not mistaken for a missing one.
+
+    Parameters
+    ----------
+    reference : array (points x 3) - coordinates of the points in the reference stage
+    coordinates : array (points x stages x 3) - coordinates of the points at each stage, nan where not found
+    distances : array (points x stages), optional - distances between the points and their reference
+    mask : array of bool (points x stages), optional - True where the point was found,
+        default where the coordinates are not nan
+    indices : array of int (points x stages), optional - index of the point in each stage cloud, -1 if unknown
+    ids : array of int (points), optional - IDs of the points
+    keys : list of str, optional - keys of the points, default is str(tuple) of the reference coordinates
+
+    """
+
+    def __init__(self, reference, coordinates, distances=None, mask=None, indices=None, ids=None, keys=None):
+        self.reference = np.asarray(reference, dtype=np.float64).reshape(-1, 3)
+        num_points = len(self.reference)
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        if coordinates.ndim != 3:
+            coordinates = coordinates.reshape(num_points, -1, 3) if num_points else coordinates.reshape(0, 0, 3)
+        self.coordinates = coordinates
+        num_stages = self.coordinates.shape[1]
+
+        if mask is None:
+            mask = np.isfinite(self.coordinates).all(axis=2)
+        self.mask = np.asarray(mask, dtype=bool)
+
+        if distances is None:
+            distances = np.linalg.norm(self.coordinates - self.reference[:, None, :], axis=2)
+            distances[~self.mask] = np.nan
+        self.distances = np.asarray(distances, dtype=np.float64)
+
+        if indices is None:
+            indices = np.full((num_points, num_stages), -1, dtype=np.int32)
+        self.indices = np.asarray(indices)
+
+        if ids is None:
+            ids = np.arange(num_points, dtype=np.int64)
+        self.ids = np.asarray(ids)
+
+        self._keys = keys
+        self._index = None
+
+    # --------------------------------------------------------------------------
+    #   constructors
+    # --------------------------------------------------------------------------
+
+    @classmethod
+    def from_dict(cls, points_history):
+        """
+        Builds the array-backed history from a points history dictionary.
+
+        Parameters
+        ----------
+        points_history : dict
+            key: string - the coordinates of a point in initial stage
+            value : sequence - a sequence of tuples describing locations of a given point in three-dimensional space
+            tuple – (distance to reference point, XYZ coordinates of the point, index of the point in the stage cloud)
+
+        Returns
+        -------
+        PointsHistory
+
+        """
+
+        keys = list(points_history.keys())
+        if not keys:
+            return cls(np.zeros((0, 3)), np.zeros((0, 0, 3)))
+        reference = [key_to_coordinates(key) for key in keys]
+        values = [points_history[key] for key in keys]
+        coordinates = np.array([[e[1] for e in value] for value in values], dtype=np.float64)
+        distances = np.array([[e[0] for e in value] for value in values], dtype=np.float64)
+        indices = np.array([[e[2] for e in value] for value in values]).astype(np.int32)
+        coordinates = coordinates.reshape(len(keys), -1, 3)
+        distances = distances.reshape(len(keys), -1)
+        indices = indices.reshape(len(keys), -1)
+        # the dictionary has no mask, the blank points are the missing ones
+        mask = (distances != 0.0) | np.any(coordinates != 0.0, axis=2)
+        coordinates[~mask] = np.nan
+        distances[~mask] = np.nan
+        indices[~mask] = -1
+
+        return cls(reference, coordinates, distances, mask, indices, keys=keys)
+
+    @classmethod
+    def from_coordinates(cls, coordinates_data, distances_data=None, val=(0.0, 0.0, 0.0)):
+        """
+        Builds the array-backed history from the coordinates (and distances) dictionaries,
+        as saved by history_to_json.
+
+        Parameters
+        ----------
+        coordinates_data : dict
+            key: string - the coordinates of a point in initial stage
+            value : list - a list of locations of a given point in three-dimensional space
+            (XYZ coordinates of the point)
+        distances_data : dict, optional
+            key: string - the coordinates of a point in initial stage
+            value : list - a list of distances between the reference point and its location
+            if not given, the distances are computed from the coordinates
+        val: any marker used to identify missing points
+
+        Returns
+        -------
+        PointsHistory
+
+        """
+
+        keys = list(coordinates_data.keys())
+        if not keys:
+            return cls(np.zeros((0, 3)), np.zeros((0, 0, 3)))
+        reference = [key_to_coordinates(key) for key in keys]
+        coordinates = np.array([coordinates_data[key] for key in keys], dtype=np.float64).reshape(len(keys), -1, 3)
+        mask = ~np.all(coordinates == np.asarray(val, dtype=np.float64), axis=2)
+        coordinates[~mask] = np.nan
+        distances = None
+        if distances_data is not None:
+            distances = np.array([distances_data[key] for key in keys], dtype=np.float64).reshape(len(keys), -1)
+            distances[~mask] = np.nan
+
+        return cls(reference, coordinates, distances, mask, keys=keys)
+
+    # --------------------------------------------------------------------------
+    #   properties
+    # --------------------------------------------------------------------------
+
+    @property
+    def num_points(self):
+        return self.coordinates.shape[0]
+
+    @property
+    def num_stages(self):
+        return self.coordinates.shape[1]
+
+    @property
+    def point_keys(self):
+        """list of str - keys of the points, in the order of the arrays."""
+        if self._keys is None:
+            self._keys = [str(tuple(p)) for p in self.reference.tolist()]
+        return self._keys
+
+    def index(self, key):
+        """
+        Returns the row of a point in the arrays.
+
+        Parameters
+        ----------
+        key : str - key of the point
+
+        Returns
+        -------
+        int
+        """
+
+        if self._index is None:
+            self._index = dict((k, i) for i, k in enumerate(self.point_keys))
+        return self._index[key]
+
+    # --------------------------------------------------------------------------
+    #   mapping
+    # --------------------------------------------------------------------------
+
+    def _point(self, i):
+        # distances, coordinates, indices and mask of a point through the stages
+        return self.distances[i], self.coordinates[i], self.indices[i], self.mask[i]
+
+    def __getitem__(self, key):
+        distances, coordinates, indices, mask = self._point(self.index(key))
+        return [(d, tuple(xyz), j) if valid else BLANK
+                for d, xyz, j, valid in zip(distances.tolist(), coordinates.tolist(), indices.tolist(), mask.tolist())]
+
+    def __iter__(self):
+        return iter(self.point_keys)
+
+    def __len__(self):
+        return self.num_points
+
+    def __contains__(self, key):
+        try:
+            self.index(key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __repr__(self):
+        return 'PointsHistory(points={}, stages={})'.format(self.num_points, self.num_stages)
+
+    # --------------------------------------------------------------------------
+    #   selection
+    # --------------------------------------------------------------------------
+
+    def _rows(self, points):
+        if isinstance(points, np.ndarray):
+            return points
+        points = list(points)
+        if not points:
+            return np.zeros(0, dtype=np.int64)
+        if isinstance(points[0], str):
+            return np.array([self.index(key) for key in points], dtype=np.int64)
+        return np.asarray(points)
+
+    def select_points(self, points):
+        """
+        Creates a new history with a subset of the points.
+
+        Parameters
+        ----------
+        points : list of str, list of int or array of bool - keys, rows or mask of the points to keep
+
+        Returns
+        -------
+        PointsHistory
+        """
+
+        rows = self._rows(points)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        keys = [self.point_keys[i] for i in rows.tolist()]
+        return PointsHistory(self.reference[rows], self.coordinates[rows], self.distances[rows],
+                             self.mask[rows], self.indices[rows], self.ids[rows], keys)
+
+    def remove_points(self, points):
+        """
+        Creates a new history without the given points.
+
+        Parameters
+        ----------
+        points : list of str or list of int - keys or rows of the points to remove
+
+        Returns
+        -------
+        PointsHistory
+        """
+
+        keep = np.ones(self.num_points, dtype=bool)
+        keep[self._rows(points).astype(np.int64)] = False
+        return self.select_points(keep)
+
+    def select_stages(self, start, stop):
+        """
+        Creates a new history restricted to a range of stages. The arrays are views on this history.
+
+        Parameters
+        ----------
+        start : int - index of the first stage
+        stop : int - index after the last stage
+
+        Returns
+        -------
+        PointsHistory
+        """
+
+        return PointsHistory(self.reference, self.coordinates[:, start:stop], self.distances[:, start:stop],
+                             self.mask[:, start:stop], self.indices[:, start:stop], self.ids, self._keys)
+
+    def view_points(self, points):
+        """
+        Creates a view on a subset of the points, without copying the arrays (see PointsHistoryView).
+
+        Parameters
+        ----------
+        points : list of str, list of int or array of bool - keys, rows or mask of the points to keep
+
+        Returns
+        -------
+        PointsHistoryView
+        """
+
+        return PointsHistoryView(self, self._rows(points))
+
+    def view_stages(self, start, stop):
+        """
+        Creates a view on a range of stages, without copying the arrays (see PointsHistoryView).
+
+        Parameters
+        ----------
+        start : int - index of the first stage
+        stop : int - index after the last stage
+
+        Returns
+        -------
+        PointsHistoryView
+        """
+
+        return PointsHistoryView(self, None, start, stop)
+
+    # --------------------------------------------------------------------------
+    #   conversion
+    # --------------------------------------------------------------------------
+
+    def to_dict(self):
+        """
+        Returns the points history dictionary.
+        """
+
+        return dict((key, self[key]) for key in self.point_keys)
+
+    def to_coordinates_dict(self):
+        """
+        Returns the dictionary of the coordinates of the points through the stages,
+        with (0.0, 0.0, 0.0) where the point was not found.
+        """
+
+        coordinates = np.where(self.mask[:, :, None], self.coordinates, 0.0)
+        return dict((key, [tuple(xyz) for xyz in value])
+                    for key, value in zip(self.point_keys, coordinates.tolist()))
+
+    def to_distances_dict(self):
+        """
+        Returns the dictionary of the distances of the points from their reference through the stages,
+        with 0.0 where the point was not found.
+        """
+
+        distances = np.where(self.mask, self.distances, 0.0)
+        return dict(zip(self.point_keys, distances.tolist()))
+
+
+# ******************************************************************************
+#   Points history view
+# ******************************************************************************
+
+class PointsHistoryView(PointsHistory):
+    """
+    Lightweight view on a subset of the points and a range of the stages of a points history.
+    Creating the view only stores the selected rows and the stage range, nothing is copied:
+    reading one point reads the underlying arrays directly, the arrays of the view are only gathered
+    (and kept) when they are accessed as a whole, and only if the view selects some of the points.
+
+    Parameters
+    ----------
+    base : PointsHistory - the history to look at, a view on a view looks at the same base history
+    rows : array of int or bool, optional - rows of the points to keep, default all
+    start : int, optional - index of the first stage
+    stop : int, optional - index after the last stage
+
+    """
+
+    def __init__(self, base, rows=None, start=None, stop=None):
+        stages = range(base.num_stages)[start:stop]
+        if rows is not None:
+            rows = np.asarray(rows)
+            rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+        if isinstance(base, PointsHistoryView):
+            if base.rows is not None:
+                rows = base.rows if rows is None else base.rows[rows]
+            stages = range(base.stages.start + stages.start, base.stages.start + stages.stop)
+            base = base.base
+        self.base = base
+        self.rows = rows
+        self.stages = slice(stages.start, stages.stop)
+        self._arrays = {}
+        self._keys = None
+        self._index = None
+
+    def _array(self, name):
+        if name not in self._arrays:
+            array = getattr(self.base, name)
+            if name not in ('reference', 'ids'):
+                array = array[:, self.stages]
+            if self.rows is None:
+                return array
+            self._arrays[name] = array[self.rows]
+        return self._arrays[name]
+
+    reference = property(lambda self: self._array('reference'))
+    coordinates = property(lambda self: self._array('coordinates'))
+    distances = property(lambda self: self._array('distances'))
+    mask = property(lambda self: self._array('mask'))
+    indices = property(lambda self: self._array('indices'))
+    ids = property(lambda self: self._array('ids'))
+
+    @property
+    def num_points(self):
+        return self.base.num_points if self.rows is None else len(self.rows)
+
+    @property
+    def num_stages(self):
+        return self.stages.stop - self.stages.start
+
+    @property
+    def point_keys(self):
+        if self._keys is None:
+            keys = self.base.point_keys
+            self._keys = keys if self.rows is None else [keys[i] for i in self.rows.tolist()]
+        return self._keys
+
+    def _point(self, i):
+        row = i if self.rows is None else self.rows[i]
+        base = self.base
+        return (base.distances[row, self.stages], base.coordinates[row, self.stages],
+                base.indices[row, self.stages], base.mask[row, self.stages])
+
+    def __repr__(self):
+        return 'PointsHistoryView(points={}, stages={})'.format(self.num_points, self.num_stages)
+
+
+# ******************************************************************************
+#   Stage matches
+# ******************************************************************************
+
+class StageMatches(Sequence):
+    """
+    Array-backed matches of the points of a stage in another stage, as found by find_points_between_stages.
+    It behaves like the list of matches of the points: each item is the tuple
+    (distance to the matching point, XYZ coordinates of the matching point, index of the matching point in the cloud),
+    with blank points (0.0, (0.0, 0.0, 0.0), 0.0) where no match was found.
+    The arrays hold nan (and -1 for the indices) where the mask is False.
+
+    Parameters
+    ----------
+    distances : array (points) - distance to the matching point
+    coordinates : array (points x 3) - coordinates of the matching point
+    indices : array of int (points) - index of the matching point in the cloud
+    mask : array of bool (points) - True where a matching point was found
+
+    """
+
+    def __init__(self, distances, coordinates, indices, mask):
+        self.distances = np.asarray(distances, dtype=np.float64)
+        self.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 3)
+        self.indices = np.asarray(indices)
+        self.mask = np.asarray(mask, dtype=bool)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if not self.mask[i]:
+            return BLANK
+        return float(self.distances[i]), tuple(self.coordinates[i].tolist()), int(self.indices[i])
+
+    def __len__(self):
+        return len(self.mask)
+
+    def __repr__(self):
+        return 'StageMatches(points={}, found={})'.format(len(self), int(self.mask.sum()))
+
+
+# ******************************************************************************
+#   Main
+# ******************************************************************************
+
+if __name__ == "__main__":
+    pass
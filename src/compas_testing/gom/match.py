@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+from scipy.spatial import cKDTree
+
+__author__ = 'Francesco Ranaudo'
+__copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
+__license__ = 'MIT License'
+__email__ = 'ranaudo@arch.ethz.ch'
+
+__all__ = ['SpatialHash',
+           'closest_points_in_cloud',
+           'assign_points_in_cloud',
+           'closest_points_in_clouds',
+           ]
+
+
+# ******************************************************************************
+#   Spatial hash
+# ******************************************************************************
+
+class SpatialHash(object):
+    """
+    Hash grid over the quantized coordinates of a set of representative points.
+    Each cell is identified by a single integer key, so looking up a cell is a dictionary access.
+    The cells are twice as large as the search radius, therefore a query only needs the cell of the point
+    and the 7 neighbouring cells on the side of the point, and points close to a cell boundary are not split.
+
+    Parameters
+    ----------
+    radius : float - radius used to look for a representative point
+
+    """
+
+    BITS = 21
+    SIZE = 1 << BITS
+    BIAS = 1 << (BITS - 1)
+
+    def __init__(self, radius):
+        self.radius = float(radius)
+        self.cell_size = 2.0 * self.radius
+        self.cells = {}
+        self.points = []
+        # neighbouring cells to visit for each octant of a cell
+        self._neighbours = []
+        for octant in range(8):
+            sx, sy, sz = [1 if octant & bit else -1 for bit in (4, 2, 1)]
+            self._neighbours.append([dx * self.SIZE * self.SIZE + dy * self.SIZE + dz
+                                     for dx in (0, sx) for dy in (0, sy) for dz in (0, sz)])
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell_keys(self, points):
+        """
+        Computes the integer keys of the cells containing a sequence of points,
+        and the octant of the cell in which each point lies.
+
+        Parameters
+        ----------
+        points : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z]
+
+        Returns
+        -------
+        keys : array of int
+        octants : array of int
+        """
+
+        scaled = np.asarray(points, dtype=np.float64).reshape(-1, 3) / self.cell_size
+        cells = np.floor(scaled)
+        octants = np.dot((scaled - cells) >= 0.5, [4, 2, 1])
+        cells = cells.astype(np.int64)
+        if cells.size and (cells.min() < -self.BIAS or cells.max() >= self.BIAS - 1):
+            raise ValueError('coordinates out of range for a radius of {}'.format(self.radius))
+        cells += self.BIAS
+        return (cells[:, 0] * self.SIZE + cells[:, 1]) * self.SIZE + cells[:, 2], octants
+
+    def add(self, point, key=None):
+        """
+        Adds a representative point to the grid.
+
+        Parameters
+        ----------
+        point : [X, Y, Z]
+        key : int, optional - the cell key of the point, if already computed
+
+        Returns
+        -------
+        index : int - index of the representative point
+        """
+
+        if key is None:
+            key = int(self.cell_keys(point)[0][0])
+        index = len(self.points)
+        self.points.append(tuple(point))
+        self.cells.setdefault(key, []).append(index)
+        return index
+
+    def find(self, point, key=None, octant=None):
+        """
+        Finds the closest representative point within the radius.
+
+        Parameters
+        ----------
+        point : [X, Y, Z]
+        key : int, optional - the cell key of the point, if already computed
+        octant : int, optional - the octant of the point in its cell, if already computed
+
+        Returns
+        -------
+        index : int or None - index of the representative point, None if there is none within the radius
+        """
+
+        if key is None or octant is None:
+            keys, octants = self.cell_keys(point)
+            key, octant = int(keys[0]), int(octants[0])
+        x, y, z = point
+        radius = self.radius * self.radius
+        found = None
+        cells = self.cells
+        points = self.points
+        for delta in self._neighbours[octant]:
+            for index in cells.get(key + delta, ()):
+                px, py, pz = points[index]
+                d = (px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2
+                if d <= radius:
+                    radius = d
+                    found = index
+        return found
+
+    def group(self, points):
+        """
+        Groups a sequence of points in a single pass: each point joins the closest representative point
+        within the radius, or becomes a new representative point.
+
+        Parameters
+        ----------
+        points : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z]
+
+        Returns
+        -------
+        labels : list of int - index of the representative point of each point
+        """
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        keys, octants = self.cell_keys(points)
+        labels = []
+        for point, key, octant in zip(points.tolist(), keys.tolist(), octants.tolist()):
+            index = self.find(point, key, octant)
+            if index is None:
+                index = self.add(point, key)
+            labels.append(index)
+        return labels
+
+
+# ******************************************************************************
+#   Matching
+# ******************************************************************************
+
+def closest_points_in_cloud(points, cloud):
+    """
+    Finds the closest point in a cloud for each point of a sequence.
+    This is the batched counterpart of the compas closest_point_in_cloud function:
+    a KD-tree is built once on the cloud and all the points are answered in a single query.
+
+    Parameters
+    ----------
+    points : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z] to look up
+    cloud : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z] to search in
+
+    Returns
+    -------
+    distances : array of float - distance between each point and its closest point in the cloud
+    indices : array of int - index in the cloud of the closest point
+
+    """
+
+    tree = cKDTree(np.asarray(cloud, dtype=float))
+    distances, indices = tree.query(np.asarray(points, dtype=float))
+    return distances, indices
+
+
+def assign_points_in_cloud(points, cloud, tolerance):
+    """
+    Finds a one-to-one matching between a sequence of points and a cloud, minimising the total distance.
+    Only the pairs closer than the tolerance are candidates: a point with a single candidate, not claimed
+    by any other point, is matched directly, and the points competing for the same cloud points are solved
+    as a single assignment problem on the sparse matrix of their candidate pairs,
+    so the cost stays close to linear in the number of candidate pairs even if all the points are close together.
+
+    Parameters
+    ----------
+    points : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z] to look up
+    cloud : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z] to search in
+    tolerance : float - max distance between two matching points
+
+    Returns
+    -------
+    distances : array of float - distance between each point and its match, inf if it has no match
+    indices : array of int - index in the cloud of the match, len(cloud) if it has no match
+
+    """
+
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    cloud = np.asarray(cloud, dtype=float).reshape(-1, 3)
+    num_points = len(points)
+    distances = np.full(num_points, np.inf)
+    indices = np.full(num_points, len(cloud), dtype=np.intp)
+
+    pairs = cKDTree(points).sparse_distance_matrix(cKDTree(cloud), tolerance, output_type='ndarray')
+    if not len(pairs):
+        return distances, indices
+    rows, cols, costs = pairs['i'], pairs['j'], pairs['v']
+
+    # a point with a single candidate, not claimed by any other point, is matched directly
+    unique = (np.bincount(rows, minlength=num_points)[rows] == 1) & (np.bincount(cols, minlength=len(cloud))[cols] == 1)
+    distances[rows[unique]] = costs[unique]
+    indices[rows[unique]] = cols[unique]
+    if unique.all():
+        return distances, indices
+
+    r, rows_inverse = np.unique(rows[~unique], return_inverse=True)
+    c, cols_inverse = np.unique(cols[~unique], return_inverse=True)
+    n = len(r)
+    # every point also gets its own "unmatched" node, whose cost outweighs any set of candidate pairs,
+    # so the number of matched points is maximised first and the matching is always complete.
+    # All the costs are shifted by 1, as every point is matched once the optimum does not change,
+    # and pairs at distance 0 are not taken for missing edges
+    unmatched = tolerance * (n + 1) + 1.0
+    graph = csr_matrix((np.concatenate([costs[~unique] + 1.0, np.full(n, unmatched + 1.0)]),
+                        (np.concatenate([rows_inverse, np.arange(n)]),
+                         np.concatenate([cols_inverse, len(c) + np.arange(n)]))),
+                       shape=(n, len(c) + n))
+    i, j = min_weight_full_bipartite_matching(graph)
+    keep = j < len(c)
+    i, j = i[keep], j[keep]
+    # the distance of the matched pairs is read back from the candidate pairs, not from the shifted costs
+    pair = csr_matrix((np.flatnonzero(~unique) + 1, (rows_inverse, cols_inverse)), shape=(n, len(c)))
+    distances[r[i]] = costs[np.asarray(pair[i, j]).ravel() - 1]
+    indices[r[i]] = c[j]
+
+    return distances, indices
+
+
+def _match_points_in_cloud(points, cloud, tolerance=None):
+    if tolerance is None:
+        return closest_points_in_cloud(points, cloud)
+    return assign_points_in_cloud(points, cloud, tolerance)
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # python < 3.13 has no track argument
+        return shared_memory.SharedMemory(name=name)
+
+
+def _closest_points_in_shared_cloud(task):
+    """
+    Worker of closest_points_in_clouds: matches a slice of the shared buffer against another slice.
+    """
+
+    name, size, (p0, p1), (c0, c1), tolerance = task
+    shm = _attach(name)
+    buffer = np.ndarray((size, 3), dtype=np.float64, buffer=shm.buf)
+    distances, indices = _match_points_in_cloud(buffer[p0:p1], buffer[c0:c1], tolerance)
+    del buffer
+    shm.close()
+    return distances, indices
+
+
+def closest_points_in_clouds(points, clouds, workers=None, tolerance=None):
+    """
+    Finds the closest points for a sequence of independent matching tasks, optionally in a process pool.
+    If a tolerance is given, every task is solved as a one-to-one assignment (see assign_points_in_cloud).
+    All the point sets and clouds are copied once in a shared memory block that the workers read directly,
+    so they are not pickled, and the results are returned in the order of the tasks.
+
+    Parameters
+    ----------
+    points : list of (sequence) – the points to look up for each task
+    clouds : list of (sequence) – the cloud to search in for each task
+    workers : int, optional - number of processes, None or 1 to match in the current process
+    tolerance : float, optional - max distance between two matching points for the one-to-one assignment,
+        None to match every point with its closest point
+
+    Returns
+    -------
+    matches : list of tuples (distances, indices) - one per task, see closest_points_in_cloud
+
+    """
+
+    if not workers or workers < 2 or len(clouds) < 2:
+        return [_match_points_in_cloud(p, c, tolerance) for p, c in zip(points, clouds)]
+
+    # store each distinct sequence once, the same reference points are usually matched against every cloud
+    arrays = []
+    slices = {}
+    ranges = []
+    size = 0
+    for sequence in list(points) + list(clouds):
+        if id(sequence) not in slices:
+            array = np.asarray(sequence, dtype=np.float64).reshape(-1, 3)
+            slices[id(sequence)] = (size, size + len(array))
+            arrays.append(array)
+            size += len(array)
+        ranges.append(slices[id(sequence)])
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * 3 * 8)
+    try:
+        buffer = np.ndarray((size, 3), dtype=np.float64, buffer=shm.buf)
+        start = 0
+        for array in arrays:
+            buffer[start:start + len(array)] = array
+            start += len(array)
+        del buffer
+
+        tasks = [(shm.name, size, p, c, tolerance) for p, c in zip(ranges[:len(clouds)], ranges[len(clouds):])]
+        chunksize = max(1, len(tasks) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            matches = list(executor.map(_closest_points_in_shared_cloud, tasks, chunksize=chunksize))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return matches
+
+
+# ******************************************************************************
+#   Main
+# ******************************************************************************
+
+if __name__ == "__main__":
+    pass
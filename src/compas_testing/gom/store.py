@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+from compas_testing.gom.history import PointsHistory
+
+__author__ = 'Francesco Ranaudo'
+__copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
+__license__ = 'MIT License'
+__email__ = 'ranaudo@arch.ethz.ch'
+
+__all__ = ['history_to_binary',
+           'history_from_binary',
+           'read_binary_header',
+           'history_to_parquet',
+           'read_parquet_history',
+           'history_from_parquet',
+           'history_to_container',
+           'HistoryContainer',
+           ]
+
+
+MAGIC = b'CTPH'
+VERSION = 1
+ALIGNMENT = 64
+ARRAYS = ['reference', 'coordinates', 'distances', 'mask', 'indices', 'ids']
+
+
+# ******************************************************************************
+#   Binary store
+# ******************************************************************************
+#
+#   layout of the file :
+#   MAGIC (4 bytes) | VERSION (uint32) | header length (uint64) | json header | arrays
+#   every array is stored raw, in C order, at an offset aligned to ALIGNMENT bytes
+
+def _custom_keys(points_history):
+    """
+    Returns the keys of the points if they cannot be rebuilt from the reference coordinates, otherwise None.
+    """
+
+    keys = points_history.point_keys
+    if keys == [str(tuple(p)) for p in points_history.reference.tolist()]:
+        return None
+    return keys
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def history_to_binary(points_history, filepath, metadata=None):
+    """
+    Saves a points history in a binary file that can be memory-mapped by history_from_binary.
+
+    Parameters
+    ----------
+    points_history : PointsHistory or dict - the points history, a dictionary is converted first
+    filepath : str - path of the file to write
+    metadata : dict, optional - json serialisable information stored in the header (e.g. tolerance, source file)
+
+    """
+
+    if not isinstance(points_history, PointsHistory):
+        points_history = PointsHistory.from_dict(points_history)
+
+    keys = _custom_keys(points_history)
+    arrays = dict((name, np.ascontiguousarray(getattr(points_history, name))) for name in ARRAYS)
+    header = {'num_points': points_history.num_points,
+              'num_stages': points_history.num_stages,
+              'keys': keys,
+              'metadata': metadata or {},
+              'arrays': {},
+              }
+
+    # the offsets depend on the header length, so the header is sized with placeholders first
+    for name in ARRAYS:
+        header['arrays'][name] = {'dtype': arrays[name].dtype.str, 'shape': arrays[name].shape, 'offset': 0}
+    start = 16 + len(json.dumps(header).encode('utf-8')) + 20 * len(ARRAYS)
+    offset = _align(start)
+    for name in ARRAYS:
+        header['arrays'][name]['offset'] = offset
+        offset = _align(offset + arrays[name].nbytes)
+    encoded = json.dumps(header).encode('utf-8')
+
+    with open(filepath, 'wb') as fp:
+        fp.write(MAGIC)
+        fp.write(struct.pack('<IQ', VERSION, len(encoded)))
+        fp.write(encoded)
+        for name in ARRAYS:
+            fp.write(b'\0' * (header['arrays'][name]['offset'] - fp.tell()))
+            fp.write(arrays[name].tobytes())
+
+
+def read_binary_header(filepath):
+    """
+    Reads the header of a binary points history file.
+
+    Parameters
+    ----------
+    filepath : str - path of the file written by history_to_binary
+
+    Returns
+    -------
+    header : dict - number of points and stages, keys, metadata and layout of the arrays
+
+    """
+
+    with open(filepath, 'rb') as fp:
+        if fp.read(4) != MAGIC:
+            raise ValueError('{} is not a binary points history file'.format(filepath))
+        version, length = struct.unpack('<IQ', fp.read(12))
+        if version > VERSION:
+            raise ValueError('unsupported binary points history version: {}'.format(version))
+        header = json.loads(fp.read(length).decode('utf-8'))
+    return header
+
+
+def history_from_binary(filepath, mode='r'):
+    """
+    Opens a binary points history file. The arrays are memory-mapped, nothing is read until it is accessed,
+    so reading one stage or one point only touches the corresponding part of the file.
+
+    Parameters
+    ----------
+    filepath : str - path of the file written by history_to_binary
+    mode : str - numpy.memmap mode, 'r' for read-only, 'r+' to modify the file in place, 'c' for copy-on-write
+
+    Returns
+    -------
+    points_history : PointsHistory - backed by memory-mapped arrays
+    metadata : dict - the metadata stored with the history
+
+    """
+
+    header = read_binary_header(filepath)
+    arrays = {}
+    for name in ARRAYS:
+        layout = header['arrays'][name]
+        shape = tuple(layout['shape'])
+        if not np.prod(shape):
+            arrays[name] = np.zeros(shape, dtype=layout['dtype'])
+            continue
+        arrays[name] = np.memmap(filepath, dtype=layout['dtype'], mode=mode, offset=layout['offset'], shape=shape)
+
+    points_history = PointsHistory(arrays['reference'], arrays['coordinates'], arrays['distances'],
+                                   arrays['mask'], arrays['indices'], arrays['ids'], header['keys'])
+    return points_history, header['metadata']
+
+
+# ******************************************************************************
+#   Parquet
+# ******************************************************************************
+
+def _parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('the parquet export requires pyarrow, install it with: pip install pyarrow')
+    return pyarrow, pyarrow.parquet
+
+
+def history_to_parquet(points_history, filepath, times=None, stages_per_group=16, metadata=None):
+    """
+    Saves a points history as a columnar table in long format, one row per point and stage:
+    point_id | ref_x | ref_y | ref_z | stage | time | x | y | z | distance | index | valid.
+    The rows are sorted by stage and every row group of the file holds a range of stages,
+    so that readers can skip the row groups outside the stages they need.
+
+    Parameters
+    ----------
+    points_history : PointsHistory or dict - the points history, a dictionary is converted first
+    filepath : str - path of the .parquet file to write
+    times : sequence of float, optional - time of each stage
+    stages_per_group : int - number of stages in each row group
+    metadata : dict, optional - json serialisable information stored in the file
+
+    """
+
+    pa, pq = _parquet()
+    if not isinstance(points_history, PointsHistory):
+        points_history = PointsHistory.from_dict(points_history)
+
+    num_points = points_history.num_points
+    num_stages = points_history.num_stages
+    times = np.full(num_stages, np.nan) if times is None else np.asarray(times, dtype=np.float64)
+
+    keys = _custom_keys(points_history)
+    if keys is not None:
+        keys = dict(zip([str(i) for i in points_history.ids.tolist()], keys))
+    info = {'num_points': num_points, 'num_stages': num_stages, 'keys': keys, 'metadata': metadata or {}}
+    schema = pa.schema([('point_id', pa.int64()),
+                        ('ref_x', pa.float64()), ('ref_y', pa.float64()), ('ref_z', pa.float64()),
+                        ('stage', pa.int32()), ('time', pa.float64()),
+                        ('x', pa.float64()), ('y', pa.float64()), ('z', pa.float64()),
+                        ('distance', pa.float64()), ('index', pa.int32()), ('valid', pa.bool_())],
+                       metadata={b'compas_testing': json.dumps(info).encode('utf-8')})
+
+    with pq.ParquetWriter(filepath, schema) as writer:
+        for start in range(0, num_stages, stages_per_group):
+            stages = np.arange(start, min(start + stages_per_group, num_stages))
+            # stage-major order: all the points of a stage, then the next stage
+            coordinates = points_history.coordinates[:, stages].transpose(1, 0, 2).reshape(-1, 3)
+            columns = [np.tile(points_history.ids, len(stages)),
+                       np.tile(points_history.reference[:, 0], len(stages)),
+                       np.tile(points_history.reference[:, 1], len(stages)),
+                       np.tile(points_history.reference[:, 2], len(stages)),
+                       np.repeat(stages, num_points).astype(np.int32),
+                       np.repeat(times[stages], num_points),
+                       coordinates[:, 0], coordinates[:, 1], coordinates[:, 2],
+                       points_history.distances[:, stages].T.ravel(),
+                       points_history.indices[:, stages].T.ravel().astype(np.int32),
+                       points_history.mask[:, stages].T.ravel()]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema), row_group_size=len(columns[0]))
+
+
+def _parquet_filters(stages, points):
+    filters = []
+    if stages is not None:
+        filters.append(('stage', '>=', int(stages[0])))
+        filters.append(('stage', '<', int(stages[1])))
+    if points is not None:
+        filters.append(('point_id', 'in', [int(p) for p in points]))
+    return filters or None
+
+
+def read_parquet_history(filepath, stages=None, points=None, columns=None):
+    """
+    Reads a points history saved by history_to_parquet as a pandas DataFrame in long format.
+    The filters are pushed down to the file, so only the row groups of the requested stages
+    and only the requested columns are read.
+
+    Parameters
+    ----------
+    filepath : str - path of the .parquet file
+    stages : [start, stop], optional - range of stages to read
+    points : list of int, optional - IDs of the points to read
+    columns : list of str, optional - columns to read, default all
+
+    Returns
+    -------
+    table : pandas DataFrame
+
+    """
+
+    pa, pq = _parquet()
+    table = pq.read_table(filepath, columns=columns, filters=_parquet_filters(stages, points))
+    return table.to_pandas()
+
+
+def history_from_parquet(filepath, stages=None, points=None):
+    """
+    Reads a points history saved by history_to_parquet, or part of it.
+
+    Parameters
+    ----------
+    filepath : str - path of the .parquet file
+    stages : [start, stop], optional - range of stages to read
+    points : list of int, optional - IDs of the points to read
+
+    Returns
+    -------
+    points_history : PointsHistory
+    metadata : dict - the metadata stored with the history
+
+    """
+
+    pa, pq = _parquet()
+    info = json.loads(pq.read_schema(filepath).metadata[b'compas_testing'].decode('utf-8'))
+    table = pq.read_table(filepath, filters=_parquet_filters(stages, points))
+
+    point_ids = table.column('point_id').to_numpy()
+    stage_ids = table.column('stage').to_numpy()
+    ids, rows = np.unique(point_ids, return_inverse=True)
+    stage_numbers, cols = np.unique(stage_ids, return_inverse=True)
+    shape = (len(ids), len(stage_numbers))
+
+    reference = np.zeros((len(ids), 3))
+    reference[rows] = np.column_stack([table.column(c).to_numpy() for c in ('ref_x', 'ref_y', 'ref_z')])
+    coordinates = np.full(shape + (3,), np.nan)
+    coordinates[rows, cols] = np.column_stack([table.column(c).to_numpy() for c in ('x', 'y', 'z')])
+    distances = np.full(shape, np.nan)
+    distances[rows, cols] = table.column('distance').to_numpy()
+    indices = np.full(shape, -1, dtype=np.int32)
+    if 'index' in table.column_names:  # files written before the index column was added
+        indices[rows, cols] = table.column('index').to_numpy()
+    mask = np.zeros(shape, dtype=bool)
+    mask[rows, cols] = table.column('valid').to_numpy(zero_copy_only=False)
+
+    keys = info['keys']
+    if keys is not None:
+        keys = [keys[str(i)] for i in ids.tolist()]
+    points_history = PointsHistory(reference, coordinates, distances, mask, indices, ids=ids, keys=keys)
+    return points_history, info['metadata']
+
+
+# ******************************************************************************
+#   Chunked container
+# ******************************************************************************
+#
+#   layout of the zip archive :
+#   header.json | reference.npy | ids.npy | <dataset>/<chunk>.npy
+#   every dataset is split along the stage axis in chunks of chunk_stages stages,
+#   each chunk is a separately compressed member, so reading a stage only inflates its chunk
+
+STAGE_DATASETS = ['coordinates', 'distances', 'mask', 'indices']
+
+
+def _write_array(archive, name, array):
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+    archive.writestr(name, buffer.getvalue())
+
+
+def _read_array(archive, name):
+    with archive.open(name) as fp:
+        return np.load(io.BytesIO(fp.read()), allow_pickle=False)
+
+
+def history_to_container(points_history, filepath, cycles=None, datasets=None, chunk_stages=32, metadata=None):
+    """
+    Saves a points history, its test cycles and any derived per-stage data in a single compressed archive.
+    The data are chunked along the stage axis and the cycles are stored as named stage ranges, not copies.
+
+    Parameters
+    ----------
+    points_history : PointsHistory or dict - the points history, a dictionary is converted first
+    filepath : str - path of the archive to write
+    cycles : dict, optional - the chunks of split_results
+        key: str - cycle name
+        value : list of int - [start, stop]
+    datasets : dict, optional - derived data to store with the history (e.g. normalised distances, colors)
+        key: str - dataset name
+        value : array (points x stages x ...) - in the order of the points of the history
+    chunk_stages : int - number of stages in each chunk
+    metadata : dict, optional - json serialisable information stored in the header
+
+    """
+
+    if not isinstance(points_history, PointsHistory):
+        points_history = PointsHistory.from_dict(points_history)
+
+    num_stages = points_history.num_stages
+    arrays = dict((name, getattr(points_history, name)) for name in STAGE_DATASETS)
+    for name, array in (datasets or {}).items():
+        if name in arrays or '/' in name:
+            raise ValueError('invalid dataset name: {}'.format(name))
+        array = np.asarray(array)
+        if array.shape[:2] != (points_history.num_points, num_stages):
+            raise ValueError('dataset {} does not have one value per point and stage'.format(name))
+        arrays[name] = array
+
+    header = {'num_points': points_history.num_points,
+              'num_stages': num_stages,
+              'chunk_stages': chunk_stages,
+              'keys': _custom_keys(points_history),
+              'cycles': dict((c, [int(ends[0]), int(ends[-1])]) for c, ends in (cycles or {}).items()),
+              'datasets': sorted(arrays),
+              'metadata': metadata or {},
+              }
+
+    with zipfile.ZipFile(filepath, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('header.json', json.dumps(header))
+        _write_array(archive, 'reference.npy', points_history.reference)
+        _write_array(archive, 'ids.npy', points_history.ids)
+        for name, array in arrays.items():
+            # an empty history still gets one empty chunk, so the shape and type of the dataset are known
+            for chunk, start in enumerate(range(0, max(num_stages, 1), chunk_stages)):
+                _write_array(archive, '{}/{:06d}.npy'.format(name, chunk), array[:, start:start + chunk_stages])
+
+
+class HistoryContainer(object):
+    """
+    Reader of the archives written by history_to_container. Only the chunks covering the requested stages
+    are decompressed, the last chunks read are kept in a small cache.
+
+    Parameters
+    ----------
+    filepath : str - path of the archive
+    cache_size : int - number of decompressed chunks kept in memory
+
+    """
+
+    def __init__(self, filepath, cache_size=8):
+        self.archive = zipfile.ZipFile(filepath, 'r')
+        self.header = json.loads(self.archive.read('header.json').decode('utf-8'))
+        self.reference = _read_array(self.archive, 'reference.npy')
+        self.ids = _read_array(self.archive, 'ids.npy')
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.archive.close()
+        self._cache = {}
+
+    @property
+    def num_stages(self):
+        return self.header['num_stages']
+
+    @property
+    def cycles(self):
+        """dict - the named stage ranges [start, stop] of the test cycles."""
+        return self.header['cycles']
+
+    @property
+    def datasets(self):
+        """list of str - the names of the stored datasets."""
+        return self.header['datasets']
+
+    @property
+    def metadata(self):
+        return self.header['metadata']
+
+    def _chunk(self, name, chunk):
+        key = (name, chunk)
+        if key not in self._cache:
+            if len(self._cache) >= self.cache_size:
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = _read_array(self.archive, '{}/{:06d}.npy'.format(name, chunk))
+        return self._cache[key]
+
+    def _range(self, start, stop, cycle):
+        # the stages are indexed as a list: negative indices count from the end (of the cycle),
+        # stop is clamped to the end, a start past the end or a stop before the beginning is out of range
+        offset, end = self.cycles[cycle] if cycle is not None else (0, self.num_stages)
+        length = end - offset
+        first = 0 if start is None else start + length if start < 0 else start
+        last = length if stop is None else stop + length if stop < 0 else stop
+        if not 0 <= first <= length or last < 0:
+            raise IndexError('stages [{}, {}] out of range for {} stages'.format(start, stop, length))
+        return offset + first, offset + min(max(first, last), length)
+
+    def read(self, name, start=None, stop=None, cycle=None):
+        """
+        Reads a dataset over a range of stages.
+
+        Parameters
+        ----------
+        name : str - name of the dataset
+        start : int, optional - first stage, relative to the cycle if one is given, negative to count from the end
+        stop : int, optional - stage after the last one, relative to the cycle if one is given,
+            negative to count from the end, clamped to the last stage
+        cycle : str, optional - name of the cycle
+
+        Returns
+        -------
+        array (points x stages x ...)
+
+        """
+
+        if name not in self.datasets:
+            raise KeyError(name)
+        start, stop = self._range(start, stop, cycle)
+        size = self.header['chunk_stages']
+        first = min(start, max(self.num_stages - 1, 0)) // size
+        last = max(first, (stop - 1) // size)
+        blocks = [self._chunk(name, chunk) for chunk in range(first, last + 1)]
+        array = blocks[0] if len(blocks) == 1 else np.concatenate(blocks, axis=1)
+        return array[:, start - first * size:stop - first * size]
+
+    def stage(self, index, cycle=None, name='coordinates'):
+        """
+        Reads one stage of a dataset, e.g. stage(87, 'c1') for the stage 87 of the cycle c1.
+
+        Parameters
+        ----------
+        index : int - index of the stage, relative to the cycle if one is given, negative to count from the end
+        cycle : str, optional - name of the cycle
+        name : str - name of the dataset
+
+        Returns
+        -------
+        array (points x ...)
+
+        """
+
+        offset, end = self.cycles[cycle] if cycle is not None else (0, self.num_stages)
+        stage = index + end - offset if index < 0 else index
+        if not 0 <= stage < end - offset:
+            raise IndexError('stage {} out of range for {} stages'.format(index, end - offset))
+        return self.read(name, offset + stage, offset + stage + 1)[:, 0]
+
+    def history(self, start=None, stop=None, cycle=None):
+        """
+        Reads the points history over a range of stages.
+
+        Parameters
+        ----------
+        start : int, optional - first stage, relative to the cycle if one is given
+        stop : int, optional - stage after the last one, relative to the cycle if one is given
+        cycle : str, optional - name of the cycle
+
+        Returns
+        -------
+        PointsHistory
+
+        """
+
+        arrays = [self.read(name, start, stop, cycle) for name in STAGE_DATASETS]
+        return PointsHistory(self.reference, *arrays, ids=self.ids, keys=self.header['keys'])
+
+
+# ******************************************************************************
+#   Main
+# ******************************************************************************
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from compas_testing.gom.history import PointsHistory
+from compas_testing.gom.match import closest_points_in_cloud
+from compas_testing.gom.match import assign_points_in_cloud
+
+__author__ = 'Francesco Ranaudo'
+__copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
+__license__ = 'MIT License'
+__email__ = 'ranaudo@arch.ethz.ch'
+
+__all__ = ['PointsTracker',
+           ]
+
+
+# ******************************************************************************
+#   Tracker
+# ******************************************************************************
+
+class PointsTracker(object):
+    """
+    Tracks a set of points through stages that are added one at a time, e.g. while the test is running.
+    Every new stage is matched against the last known position of each point, so the cost of a stage
+    only depends on the size of that stage, and the displacements are available right after each stage.
+
+    Parameters
+    ----------
+    reference : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z] - the reference stage
+    tolerance : float - max distance between the last known position of a point and its match
+    mode : str - 'nearest' or 'assignment', see find_points_from_stage
+    keys : list of str, optional - keys of the points, default is str(tuple) of the reference coordinates
+
+    """
+
+    def __init__(self, reference, tolerance=50, mode='nearest', keys=None):
+        if mode not in ('nearest', 'assignment'):
+            raise ValueError("unknown matching mode: {}, use 'nearest' or 'assignment'".format(mode))
+        self.tolerance = tolerance
+        self.mode = mode
+        self.reference = np.asarray(reference, dtype=np.float64).reshape(-1, 3)
+        self.positions = self.reference.copy()
+        self.keys = keys if keys is not None else [str(tuple(p)) for p in self.reference.tolist()]
+        self.num_stages = 0
+        self.max_key = None
+        self.max_stage = None
+        self.max_val = 0.0
+        self._allocate(16)
+
+    def _allocate(self, capacity):
+        num_points = len(self.reference)
+        coordinates = np.full((num_points, capacity, 3), np.nan)
+        distances = np.full((num_points, capacity), np.nan)
+        indices = np.full((num_points, capacity), -1, dtype=np.int32)
+        mask = np.zeros((num_points, capacity), dtype=bool)
+        if self.num_stages:
+            coordinates[:, :self.num_stages] = self._coordinates[:, :self.num_stages]
+            distances[:, :self.num_stages] = self._distances[:, :self.num_stages]
+            indices[:, :self.num_stages] = self._indices[:, :self.num_stages]
+            mask[:, :self.num_stages] = self._mask[:, :self.num_stages]
+        self._coordinates = coordinates
+        self._distances = distances
+        self._indices = indices
+        self._mask = mask
+
+    @property
+    def history(self):
+        """PointsHistory - the tracked stages, as views on the track arrays."""
+        n = self.num_stages
+        return PointsHistory(self.reference, self._coordinates[:, :n], self._distances[:, :n],
+                             self._mask[:, :n], self._indices[:, :n], keys=self.keys)
+
+    def add_stage(self, cloud):
+        """
+        Matches a new stage and updates the tracks.
+
+        Parameters
+        ----------
+        cloud : (sequence) – A sequence of locations in three-dimensional space [X, Y, Z] - the new stage
+
+        Returns
+        -------
+        displacements : array of float - distance of each point from its reference, nan if it was not found
+        maximum : tuple (max_key, max_stage, max_val) - absolute maximum displacement over all the tracked stages
+
+        """
+
+        cloud = np.asarray(cloud, dtype=np.float64).reshape(-1, 3)
+        if self.mode == 'assignment':
+            d, i = assign_points_in_cloud(self.positions, cloud, self.tolerance)
+        else:
+            d, i = closest_points_in_cloud(self.positions, cloud)
+        found = d <= self.tolerance
+
+        n = self.num_stages
+        if n == self._mask.shape[1]:
+            self._allocate(2 * n)
+        self.positions[found] = cloud[i[found]]
+        displacements = np.linalg.norm(self.positions - self.reference, axis=1)
+        displacements[~found] = np.nan
+
+        self._coordinates[found, n] = self.positions[found]
+        self._distances[found, n] = displacements[found]
+        self._indices[found, n] = i[found]
+        self._mask[:, n] = found
+        self.num_stages += 1
+
+        if found.any():
+            row = int(np.nanargmax(displacements))
+            if displacements[row] > self.max_val or self.max_key is None:
+                self.max_key = self.keys[row]
+                self.max_stage = n
+                self.max_val = float(displacements[row])
+
+        return displacements, (self.max_key, self.max_stage, self.max_val)
+
+
+# ******************************************************************************
+#   Main
+# ******************************************************************************
+
+if __name__ == "__main__":
+    pass
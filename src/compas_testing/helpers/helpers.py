@@ -1,5 +1,7 @@
 
+import re
 import json
+import gzip
 
 __author__     = 'Francesco Ranaudo'
 __copyright__  = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
@@ -115,14 +117,89 @@ def get_test_key(points_history): # TODO: remove after development
 #   json
 # ******************************************************************************
 
-def read_json(file):
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def _iter_json_object(fp, chunk_size=65536):
+    """
+    Iterates over the key, value pairs of the json object in a file, decoding one value at a time.
+
+    Parameters
+    ----------
+    fp : file - opened in text mode
+    chunk_size : int - number of characters read at a time
+
+    Yields
+    ------
+    key : str
+    value : the decoded value
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def skip(buffer, pos, eof):
+        # skips the whitespace and makes sure there is at least one character to read
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return buffer, pos, eof
+            data = fp.read(chunk_size)
+            buffer, pos, eof = buffer[pos:] + data, 0, not data
+
+    def decode(buffer, pos, eof):
+        # decodes the next value, reading more text until it is complete:
+        # a value that ends with the buffer (e.g. a number) may be truncated
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                if end < len(buffer) or eof:
+                    return value, buffer, end, eof
+            except ValueError:
+                if eof:
+                    raise
+            data = fp.read(max(chunk_size, len(buffer) - pos))
+            buffer, pos, eof = buffer[pos:] + data, 0, not data
+
+    buffer, pos, eof = skip(buffer, pos, eof)
+    if buffer[pos:pos + 1] != '{':
+        raise ValueError('the json file does not contain an object')
+    buffer, pos, eof = skip(buffer, pos + 1, eof)
+    if buffer[pos:pos + 1] == '}':
+        return
+
+    while True:
+        key, buffer, pos, eof = decode(buffer, pos, eof)
+        buffer, pos, eof = skip(buffer, pos, eof)
+        if buffer[pos:pos + 1] != ':':
+            raise ValueError('expecting a colon after key {}'.format(key))
+        buffer, pos, eof = skip(buffer, pos + 1, eof)
+        value, buffer, pos, eof = decode(buffer, pos, eof)
+        yield key, value
+        buffer, pos, eof = skip(buffer, pos, eof)
+        delimiter = buffer[pos:pos + 1]
+        if delimiter == '}':
+            return
+        if delimiter != ',':
+            raise ValueError('expecting a comma after the value of key {}'.format(key))
+        # the text already decoded is only dropped when the buffer is refilled, in skip or decode
+        buffer, pos, eof = skip(buffer, pos + 1, eof)
+
+
+def read_json(file, keys=None, stages=None):
     """
     Reads a json file and returns a dictionary.
+    If keys or stages are given, the file is scanned one entry at a time and only the selection is kept,
+    so the memory used depends on the size of the selection rather than on the size of the file.
 
     Parameters
     ----------
     file : json file
-        A json file with collected data.
+        A json file with collected data, gzip compressed if the name ends with .gz
+    keys : list of str, optional - keys to read, e.g. the keys of some points, the scan stops once all are found
+    stages : list of int, optional - [start, stop] range of the stages to read from each value
 
     Returns
     -------
@@ -130,28 +207,71 @@ def read_json(file):
 
     """
 
-    with open(file, 'r') as fp:
-        data = json.load(fp)
+    if file.endswith('.gz'):
+        fp = gzip.open(file, 'rt')
+    else:
+        fp = open(file, 'r')
+
+    with fp:
+        if keys is None and stages is None:
+            return json.load(fp)
+
+        wanted = set(keys) if keys is not None else None
+        data = {}
+        for key, value in _iter_json_object(fp):
+            if wanted is not None and key not in wanted:
+                continue
+            if stages is not None:
+                value = value[stages[0]:stages[-1]]
+            data[key] = value
+            if wanted is not None and len(data) == len(wanted):
+                break
     return data
 
 
-def combine_dict_in_json(dict_list, destination, json_name):
+def _to_json_value(value):
+    # array values (e.g. memory-mapped) are converted to lists
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+def _to_json_key(key):
+    # keys are converted to strings as json.dump does
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    raise TypeError('keys must be str, int, float, bool or None, not {}'.format(type(key).__name__))
+
+
+def combine_dict_in_json(dict_list, destination, json_name, compress=False):
     """
-    Combines the values of a list of dictionaries in a single json file
+    Combines the values of a list of dictionaries in a single json file.
+    The keys are walked once and every combined record is written to the file straight away,
+    so the combined dictionary is never built in memory.
 
     Parameters
     ----------
     dict_list : list of dict - dictionaries to combine (note: the dictionaries must have the same keys)
+        any mapping can be used, e.g. a lazily loaded or array-backed one, array values are converted to lists
     destination : str - path where to save the json file.
     json_name - str - name of the file (example_name)
+    compress : bool - write a gzip compressed file (.json.gz), read_json can load it
 
     """
-    new_dict = {}
-    for k in dict_list[0].keys():
-        new_dict[k] = tuple(new_dict[k] for new_dict in dict_list)
 
-    with open(destination + '/' + json_name + '.json', 'w') as fp:
-        json.dump(new_dict, fp, indent=1)
+    if compress:
+        fp = gzip.open(destination + '/' + json_name + '.json.gz', 'wt')
+    else:
+        fp = open(destination + '/' + json_name + '.json', 'w')
+
+    # same layout as json.dump(combined, fp, indent=1)
+    with fp:
+        separator = '{\n '
+        for k in dict_list[0].keys():
+            record = [_to_json_value(d[k]) for d in dict_list]
+            fp.write(separator + json.dumps(_to_json_key(k)) + ': ' + json.dumps(record, indent=1).replace('\n', '\n '))
+            separator = ',\n '
+        fp.write('{}' if separator == '{\n ' else '\n}')
 
 
 # ******************************************************************************
@@ -12,8 +12,23 @@ Import / Export
     :toctree: generated/
     :nosignatures:
 
+    read_material_results
     parse_material_results
+    read_catman_header
     parse_spider_results
+    load_spider_results
+
+
+Events
+======
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+
+    parse_events
+    event_intervals
+    event_chunks
 
 
 Evaluate
@@ -26,6 +41,17 @@ Evaluate
     double_punch
 
 
+Pyramid
+=======
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+
+    ChannelPyramid
+    build_pyramid
+
+
 Plot Results
 ============
 
@@ -50,6 +76,8 @@ Report
 """
 
 from .in_out import *
+from .events import *
+from .pyramid import *
 from .evaluate import *
 from .plot import *
 from .report import *
@@ -0,0 +1,189 @@
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+__author__ = 'Francesco Ranaudo'
+__copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
+__license__ = 'MIT License'
+__email__ = 'ranaudo@arch.ethz.ch'
+
+__all__ = ['parse_events',
+           'event_intervals',
+           'event_chunks',
+           ]
+
+
+EVENT_KINDS = [('start', re.compile(r'DAQ job .* started')),
+               ('save', re.compile(r'Data saved \(cycle (\d+)\)')),
+               ('stop', re.compile(r'DAQ job terminated')),
+               ]
+
+
+# ******************************************************************************
+#   Events
+# ******************************************************************************
+
+def parse_events(input_file):
+    """
+    Parses one or more catman .events files, e.g.
+    17.12.2019 16:07:07 <tab> 0.00 s <tab> DAQ job Job1 started
+
+    Parameters
+    ----------
+    input_file : str or list of str - path of the .events file(s), the events found in several files are kept once
+
+    Returns
+    -------
+    events : pandas DataFrame - sorted by date
+        Date : datetime - time of the event
+        Time [s] : float - time of the event written by catman
+        Message : str
+        Kind : str - 'start', 'save', 'stop' or 'other'
+        Cycle : float - number of the saved cycle, nan for the other events
+        events.attrs['exports'] : dict - for the last job started in each file, the date of its start and the number
+            of the export it wrote, read from the file name (cycleNN_...) as in load_spider_results
+
+    """
+
+    files = [input_file] if isinstance(input_file, str) else list(input_file)
+    rows = []
+    exports = {}
+    for n, events_file in enumerate(sorted(files)):
+        match = re.search(r'cycle(\d+)', os.path.basename(events_file))
+        last_start = None
+        with open(events_file, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) < 3:
+                    continue
+                kind, cycle = 'other', np.nan
+                for name, pattern in EVENT_KINDS:
+                    match_kind = pattern.search(fields[2])
+                    if match_kind:
+                        kind = name
+                        cycle = float(match_kind.group(1)) if match_kind.groups() else np.nan
+                        break
+                date = datetime.strptime(fields[0], '%d.%m.%Y %H:%M:%S')
+                if kind == 'start':
+                    last_start = date
+                rows.append((date, float(fields[1].split()[0]), fields[2], kind, cycle))
+        if last_start is not None:
+            exports[pd.Timestamp(last_start)] = int(match.group(1)) if match else n
+
+    events = pd.DataFrame(rows, columns=['Date', 'Time [s]', 'Message', 'Kind', 'Cycle'])
+    events = events.drop_duplicates().sort_values('Date', kind='stable').reset_index(drop=True)
+    events.attrs['exports'] = exports
+    return events
+
+
+def event_intervals(events, by='job'):
+    """
+    Builds the time intervals of the acquisition from the events.
+    The intervals are indexed by a pandas IntervalIndex, closed on the left,
+    so the interval of a date is a single lookup: intervals.index.get_indexer(dates).
+    Cycle n of a job runs up to the event Data saved (cycle n), the samples recorded after the last save
+    make the next cycle.
+
+    Parameters
+    ----------
+    events : pandas DataFrame - the events, see parse_events
+    by : str - 'job' for one interval per DAQ job, from its start to its termination,
+        'cycle' to split the jobs further at every saved cycle
+
+    Returns
+    -------
+    intervals : pandas DataFrame - indexed by the interval of dates
+        Name : str - j<job> for the jobs, j<job>_c<saved> for the cycles, e.g. j10_c1
+        Job : int - number of the DAQ job in the events
+        Saved : int - number of the saved cycle in the job, 0 for the jobs
+        Cycle : float - number of the export written by the job, as the Cycle column of load_spider_results,
+            nan if the job has no export among the parsed files
+        Start : datetime
+        Stop : datetime - pandas.Timestamp.max if the last job was not terminated
+
+    """
+
+    if by not in ('job', 'cycle'):
+        raise ValueError("unknown interval type: {}, use 'job' or 'cycle'".format(by))
+
+    bounds = []
+    job = -1
+    saved = 0
+    start = None
+    starts = []
+    for date, kind, cycle in zip(events['Date'], events['Kind'], events['Cycle']):
+        if kind == 'start':
+            if start is not None:
+                bounds.append((job, saved, start, date))
+            job += 1
+            saved = 1 if by == 'cycle' else 0
+            start = date
+            starts.append(pd.Timestamp(date))
+        elif kind == 'save' and by == 'cycle' and start is not None:
+            saved = int(cycle)
+            bounds.append((job, saved, start, date))
+            saved += 1
+            start = date
+        elif kind == 'stop' and start is not None:
+            bounds.append((job, saved, start, date))
+            start = None
+    if start is not None:
+        # the acquisition was still running when the events were saved
+        bounds.append((job, saved, start, pd.Timestamp.max))
+
+    exports = events.attrs.get('exports', {})
+    bounds = [b for b in bounds if b[3] > b[2]]
+    intervals = pd.DataFrame({'Name': ['j{}_c{}'.format(b[0], b[1]) if by == 'cycle' else 'j{}'.format(b[0])
+                                       for b in bounds],
+                              'Job': [b[0] for b in bounds],
+                              'Saved': [b[1] for b in bounds],
+                              'Cycle': [float(exports.get(starts[b[0]], np.nan)) for b in bounds],
+                              'Start': pd.to_datetime([b[2] for b in bounds]),
+                              'Stop': pd.to_datetime([b[3] for b in bounds])})
+    intervals.index = pd.IntervalIndex.from_arrays(intervals['Start'], intervals['Stop'], closed='left')
+    return intervals
+
+
+def event_chunks(intervals, times, origin, names=None):
+    """
+    Maps the time intervals of the events to index ranges in a sequence of samples or stages,
+    in the format of the chunks of gom.split_results. The ranges are found by binary search,
+    the intervals without any sample are left out.
+
+    Parameters
+    ----------
+    intervals : pandas DataFrame - the intervals, see event_intervals
+    times : sequence of float - sorted times of the samples or stages, in seconds since the origin,
+        e.g. the time column of load_spider_results or the times of the GOM stages
+    origin : datetime - the date of time 0, e.g. pd_data.attrs['t0'] for load_spider_results
+    names : list of str, optional - names of the intervals to map, default all
+
+    Returns
+    -------
+    chunks : dict
+        key: str - name of the interval
+        value : list of int - [start, stop]
+
+    """
+
+    times = np.asarray(times, dtype=np.float64)
+    if names is not None:
+        intervals = intervals[intervals['Name'].isin(names)]
+    origin = pd.Timestamp(origin)
+    starts = (intervals['Start'] - origin).dt.total_seconds().to_numpy()
+    stops = (intervals['Stop'] - origin).dt.total_seconds().to_numpy()
+    first = np.searchsorted(times, starts, side='left')
+    last = np.searchsorted(times, stops, side='left')
+
+    return dict((name, [int(i), int(j)]) for name, i, j in zip(intervals['Name'], first, last) if j > i)
+
+
+# ******************************************************************************
+#   Main
+# ******************************************************************************
+
+if __name__ == "__main__":
+    pass
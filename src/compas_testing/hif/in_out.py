@@ -1,4 +1,12 @@
+import os
+import re
 import csv
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
 
 __author__ = 'Francesco Ranaudo'
@@ -6,87 +14,317 @@ __copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
 __license__ = 'MIT License'
 __email__ = 'ranaudo@arch.ethz.ch'
 
-__all__ = ['parse_material_results',
+__all__ = ['read_material_results',
+           'parse_material_results',
+           'read_catman_header',
            'parse_spider_results',
+           'load_spider_results',
            ]
 
 
-def parse_material_results(input_file, type):
+MATERIAL_HEADERS = {'compression': ['Index', 'Element', 'Markierung', 'Time [s]', 'Force [kN]', 'Extern [mm]',
+                                    'Def. 2A [mm]', 'Def. 2B [mm]', 'Def. 2C [mm]'],
+                    'double punch': ['Index', 'Element', 'Markierung', 'Time [s]', 'Force [kN]', 'Extern [mm]'],
+                    }
+MATERIAL_INTEGERS = ['Index', 'Element', 'Markierung']
+
+TIME_UNITS = {'us': 1e-6, 'ms': 1e-3, 's': 1.0, 'min': 60.0, 'h': 3600.0}
+
+
+def _parse_material_file(input_file, type):
     """
-    parse the .txt result file and format it
+    Finds the specimen logs of a material test file, then parses all the measurements in a single call.
     """
-    data = []
-    pd_data = []
-    info = []
-    test_summary = []
 
-    # Read the txt file and split it into separate tests
+    if type not in MATERIAL_HEADERS:
+        raise ValueError("unknown test type: {}, use one of {}".format(type, sorted(MATERIAL_HEADERS)))
+    headers = MATERIAL_HEADERS[type]
+
+    # the logs are separated by empty lines, every log is a summary line,
+    # the names and units lines, then the measurements
+    info = []
+    summaries = []
+    counts = []
+    skip = set(range(4))
+    start = None
     with open(input_file, newline='') as f:
-        r = csv.reader(f, delimiter=';')
-        log = []
-        for i, l in enumerate(r):
-            # Get general info
+        for i, line in enumerate(f):
             if i < 4:
-                info.append(l)
+                info.append(line.rstrip('\r\n'))
                 continue
-            if not l:
-                data.append(log)
-                log = []
+            if not line.strip():
+                skip.add(i)
+                start = None
                 continue
-            log.append(l)
+            if start is None:
+                start = i
+                summaries.append(line.rstrip('\r\n').split(';'))
+                counts.append(0)
+            if i < start + 3:
+                skip.add(i)
+            else:
+                counts[-1] += 1
+    info = [row for row in csv.reader(info, delimiter=';')]
 
-    # Set the headers for the panda tables
-    if type == 'compression':
-        headers = ['Index', 'Element', 'Markierung', 'Time [s]', 'Force [kN]', 'Extern [mm]',
-                   'Def. 2A [mm]', 'Def. 2B [mm]', 'Def. 2C [mm]']
-    elif type == 'double punch':
-        headers = ['Index', 'Element', 'Markierung', 'Time [s]', 'Force [kN]', 'Extern [mm]']
+    dtypes = dict((name, np.int64 if name in MATERIAL_INTEGERS else np.float64) for name in headers)
+    results = pd.read_csv(input_file, sep=';', header=None, names=headers, dtype=dtypes, skiprows=skip,
+                          skip_blank_lines=False, engine='c')
 
-    # Split the lists
-    for t in range(len(data)):
-        test_summary.append(data[t][0])
-        data[t] = data[t][3:]
-        for el in range(len(data[t])):
-            for item in range(len(data[t][el])):
-                data[t][el][item] = float(data[t][el][item])
-        pd_data.append(pd.DataFrame(data=data[t], columns=headers))
+    return info, summaries, counts, results
 
-    return [info, data, pd_data, test_summary]
 
+def read_material_results(input_file, type):
+    """
+    Parses a material test file in a single pass. The measurements of all the specimens are parsed
+    in one call and returned in one table indexed by specimen and sample.
+
+    Parameters
+    ----------
+    input_file : str - path of the .txt file
+    type : str - 'compression' or 'double punch'
+
+    Returns
+    -------
+    info : list of list of str - the general information at the top of the file
+    results : pandas DataFrame - the measurements, indexed by (specimen, sample)
+    summary : pandas DataFrame - the summary line of each specimen indexed by specimen,
+        the columns are the positions of the fields in the line
 
-def parse_spider_results(input_file):
+    """
+
+    info, summaries, counts, results = _parse_material_file(input_file, type)
+
+    specimens = [int(row[0]) for row in summaries]
+    summary = pd.DataFrame([[float(v) for v in row[1:]] for row in summaries],
+                           index=pd.Index(specimens, name='Specimen'))
+    summary.columns = range(1, len(summary.columns) + 1)
+
+    samples = np.arange(len(results)) - np.repeat(np.cumsum(counts) - counts, counts)
+    results.index = pd.MultiIndex.from_arrays([np.repeat(specimens, counts), samples], names=['Specimen', 'Sample'])
+
+    return info, results, summary
+
+
+def parse_material_results(input_file, type):
     """
     parse the .txt result file and format it
+    (see read_material_results to get all the specimens in a single table)
     """
 
-    data = []
-    pd_data = []
-    info = []
-    # Read the txt file and split it into separate tests
+    info, summaries, counts, results = _parse_material_file(input_file, type)
+    blocks = np.split(results.to_numpy(dtype=np.float64), np.cumsum(counts)[:-1])
+
+    data = [block.tolist() for block in blocks]
+    pd_data = [pd.DataFrame(data=block, columns=results.columns) for block in blocks]
+
+    return [info, data, pd_data, summaries]
+
+
+def _parse_dt(field):
+    # e.g. 'dt =500 ms'
+    value, _, unit = field.split('=', 1)[-1].strip().partition(' ')
+    return float(value) * TIME_UNITS.get(unit.strip(), 1.0)
+
+
+def _parse_t0(field):
+    # e.g. 'T0 =19.12.18 17:46:04', the date is written as yy.mm.dd
+    try:
+        return datetime.strptime(field.split('=', 1)[-1].strip(), '%y.%m.%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def read_catman_header(input_file):
+    """
+    Reads the header of a HBM catman text export: the CHANNELS, SEPARATOR and MAXLINES fields,
+    the names and units of the channels, and the start time T0 and sampling interval dt of each channel.
+    The header ends with the first empty line after the channel names.
+
+    Parameters
+    ----------
+    input_file : str - path of the .txt file exported by catman
+
+    Returns
+    -------
+    header : dict
+        info : list of list of str - the non empty lines of the header, split on the separator
+        channels : int - number of channels
+        maxlines : int or None - number of samples announced in the header
+        separator : str - the column separator
+        names : list of str - names of the channels
+        units : list of str - units of the channels
+        t0 : list of datetime - start time of each channel, None if it cannot be read
+        dt : list of float - sampling interval of each channel in seconds
+        header_lines : int - number of lines before the numeric block
+
+    """
+
+    fields = {}
+    lines = []
+    names_line = None
     with open(input_file, newline='') as f:
-        r = csv.reader(f, delimiter='\t')
-        for i, l in enumerate(r):
-            # Get general info
-            if i < 37:
-                if not l:
-                    continue
-                else:
-                    info.append(l)
-                    continue
-            if not l:
-                continue
-            data.append(l)
-
-    # Remove last empty column
-    for l in range(len(data)):
-        data[l].pop()
-        for i in range(len(data[l])):
-            data[l][i] = float(data[l][i])
-    # Set the headers ad convert to pandas dataframe
-    headers = info[6]
-    pd_data = pd.DataFrame(data=data, columns=headers)
-
-    return [info, data, pd_data]
+        for line in f:
+            line = line.rstrip('\r\n')
+            lines.append(line)
+            if names_line is None:
+                key, colon, value = line.partition(':')
+                if colon and key in ('CHANNELS', 'SEPARATOR', 'MAXLINES'):
+                    fields[key] = value.strip()
+                elif line and 'CHANNELS' in fields:
+                    names_line = len(lines) - 1
+            elif not line:
+                break
+
+    if names_line is None:
+        raise ValueError('{} is not a catman text export'.format(input_file))
+
+    separator = chr(int(fields.get('SEPARATOR', 9)))
+    channels = int(fields['CHANNELS'])
+    rows = [line.split(separator) for line in lines[names_line:] if line]
+    header = {'info': [row for row in csv.reader(lines, delimiter=separator) if row],
+              'channels': channels,
+              'maxlines': int(fields['MAXLINES']) if 'MAXLINES' in fields else None,
+              'separator': separator,
+              'names': rows[0][:channels],
+              'units': (rows[1] + [''] * channels)[:channels] if len(rows) > 1 else [],
+              't0': [None] * channels,
+              'dt': [None] * channels,
+              'header_lines': len(lines),
+              }
+    for row in rows[1:]:
+        if row[0].startswith('T0 ='):
+            header['t0'] = [_parse_t0(field) for field in row[:channels]]
+        elif row[0].startswith('dt ='):
+            header['dt'] = [_parse_dt(field) for field in row[:channels]]
+    return header
+
+
+def _read_catman_data(input_file, header):
+    # every data line ends with a separator, the empty last column is not read
+    return pd.read_csv(input_file, sep=header['separator'], header=None, skiprows=header['header_lines'],
+                       usecols=range(header['channels']), names=header['names'], dtype=np.float64,
+                       skip_blank_lines=True, engine='c')
+
+
+def parse_spider_results(input_file):
+    """
+    Parses a HBM catman text export. The layout is read from the header (see read_catman_header)
+    and the numeric block is parsed in a single call of the pandas C parser.
+
+    Parameters
+    ----------
+    input_file : str - path of the .txt file exported by catman
+
+    Returns
+    -------
+    info : list of list of str - the non empty lines of the header
+    data : array (samples x channels) - the measurements
+    pd_data : pandas DataFrame - the measurements with the channel names as columns
+
+    """
+
+    header = read_catman_header(input_file)
+    pd_data = _read_catman_data(input_file, header)
+    data = pd_data.to_numpy()
+
+    return [header['info'], data, pd_data]
+
+
+def _spider_cache_paths(input_file, cache):
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(cache, name + '.json'), os.path.join(cache, name + '.npy')
+
+
+def _load_spider_file(task):
+    """
+    Worker of load_spider_results: parses a catman export, or loads it from the cache if it is up to date.
+    """
+
+    input_file, cache = task
+    stat = os.stat(input_file)
+    source = {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    if cache:
+        header_path, data_path = _spider_cache_paths(input_file, cache)
+        if os.path.exists(header_path) and os.path.exists(data_path):
+            with open(header_path, 'r') as fp:
+                header = json.load(fp)
+            if header['source'] == source:
+                header['t0'] = [datetime.strptime(t0, '%Y-%m-%dT%H:%M:%S') if t0 else None for t0 in header['t0']]
+                return header, np.load(data_path)
+
+    header = read_catman_header(input_file)
+    data = _read_catman_data(input_file, header).to_numpy()
+    header = {'names': header['names'], 'units': header['units'], 't0': header['t0'], 'dt': header['dt'],
+              'source': source}
+
+    if cache:
+        if not os.path.isdir(cache):
+            os.makedirs(cache)
+        np.save(data_path, data)
+        with open(header_path, 'w') as fp:
+            json.dump(dict(header, t0=[t0.isoformat() if t0 else None for t0 in header['t0']]), fp)
+
+    return header, data
+
+
+def load_spider_results(path, pattern='cycle*.txt', workers=None, cache=None):
+    """
+    Loads the catman exports of all the cycles of a test in one continuous time series.
+    The files are parsed in a process pool, and the time column is shifted by the start time T0
+    of each file, so that the pauses between the cycles are kept.
+
+    Parameters
+    ----------
+    path : str - directory of the exports, or glob pattern of the files
+    pattern : str - glob pattern of the files in the directory
+    workers : int, optional - number of processes, None or 1 to parse in the current process
+    cache : str, optional - directory where the parsed files are kept, files that did not change
+        since they were cached are not parsed again
+
+    Returns
+    -------
+    pd_data : pandas DataFrame - the measurements of all the files sorted by name, with a Cycle column,
+        the time column is the time since the start of the first file, stored in pd_data.attrs['t0']
+
+    """
+
+    files = sorted(glob.glob(os.path.join(path, pattern) if os.path.isdir(path) else path))
+    if not files:
+        raise ValueError('no catman export found in {}'.format(path))
+
+    tasks = [(input_file, cache) for input_file in files]
+    if not workers or workers < 2 or len(files) < 2:
+        results = [_load_spider_file(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_load_spider_file, tasks))
+
+    names = results[0][0]['names']
+    frames = []
+    start = results[0][0]['t0'][0]
+    end = 0.0
+    for i, (input_file, (header, data)) in enumerate(zip(files, results)):
+        if header['names'] != names:
+            raise ValueError('the channels of {} do not match the first file'.format(input_file))
+        match = re.search(r'cycle(\d+)', os.path.basename(input_file))
+        cycle = int(match.group(1)) if match else i
+        t0 = header['t0'][0]
+        if t0 is not None and start is not None:
+            offset = (t0 - start).total_seconds()
+        else:
+            # no start time, the file follows the previous one
+            offset = end + (header['dt'][0] or 0.0) if frames else 0.0
+        frame = pd.DataFrame(data, columns=names)
+        frame[names[0]] += offset - (data[0, 0] if len(data) else 0.0)
+        frame['Cycle'] = cycle
+        if len(data):
+            end = frame[names[0]].iloc[-1]
+        frames.append(frame)
+
+    pd_data = pd.concat(frames, ignore_index=True)
+    pd_data.attrs['t0'] = start
+    return pd_data
 
 
 # ******************************************************************************
@@ -1,6 +1,10 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+
+from compas_testing.hif.pyramid import ChannelPyramid
+
 sns.set()
 sns.set_palette(sns.color_palette("husl", 8))
 
@@ -24,25 +28,78 @@ def plot_material_results(my_pd_data):
     pass
 
 
-def plot_forces(pdf):
+TIME = 'Time  1 - default sample rate CH=1'
+
+
+def _pyramid(pdf):
+    if isinstance(pdf, ChannelPyramid):
+        return pdf
+    return ChannelPyramid.from_dataframe(pdf, time=TIME)
+
+
+def _plot_channel(ax, pyramid, y, width):
+    """
+    Plots the mean of a channel with its min / max envelope, at the resolution of the visible time window.
+    The curve is queried again from the pyramid when the view is zoomed or panned.
+    """
+
+    time, minimum, maximum, mean = pyramid.query(y, width=width)
+    line, = ax.plot(time, mean[:, 0], label=y)
+    envelope = ax.fill_between(time, minimum[:, 0], maximum[:, 0], color=line.get_color(), alpha=0.3, lw=0)
+
+    def update(ax):
+        start, stop = sorted(ax.get_xlim())
+        time, minimum, maximum, mean = pyramid.query(y, start, stop, width)
+        line.set_data(time, mean[:, 0])
+        # the envelope is updated in place, adding a new one would rescale the view
+        envelope.set_verts([np.concatenate([np.column_stack([time, minimum[:, 0]]),
+                                            np.column_stack([time[::-1], maximum[::-1, 0]])])])
+
+    ax.callbacks.connect('xlim_changed', update)
+    ax.legend()
+
+
+def _plot_pair(ax, pyramid, x, y, width):
+    """
+    Plots a channel against another one, from the means of the buckets.
+    """
+
+    _, _, _, mean = pyramid.query([x, y], width=width)
+    ax.plot(mean[:, 0], mean[:, 1], label=y)
+    ax.legend()
+
+
+def plot_forces(pdf, width=2000):
+    """
+    Plots the forces against time. The channels are drawn from a min / max pyramid (see ChannelPyramid),
+    with at most width buckets in the visible window.
+
+    Parameters
+    ----------
+    pdf : pandas DataFrame or ChannelPyramid - the results, see parse_spider_results
+    width : int - number of buckets drawn, about the width of the plot in pixels
+
+    """
+
+    pyramid = _pyramid(pdf)
     fig, axs = plt.subplots(3, 1, constrained_layout=True)
     fig.suptitle('Force vs. Time', fontsize = 16)
 
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='Pressure CH=2', ax=axs[0], kind = 'line')
+    _plot_channel(axs[0], pyramid, 'Pressure CH=2', width)
     axs[0].set_title('Applied Pressure')
     axs[0].set_xlabel('Time [s]')
     axs[0].set_ylabel('Pressure [bar]')
 
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='Total Applied Force', ax=axs[1], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='Total Ties Tension', ax=axs[1], kind = 'line')
+    _plot_channel(axs[1], pyramid, 'Total Applied Force', width)
+    _plot_channel(axs[1], pyramid, 'Total Ties Tension', width)
     axs[1].set_title('Total Forces')
     axs[1].set_xlabel('Time [s]')
     axs[1].set_ylabel('Force [kN]')
 
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='Force_south CH=3', ax=axs[2], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='Force_north CH=4', ax=axs[2], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='TR_south CH=5', ax=axs[2], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='TR_north CH=6', ax=axs[2], kind = 'line')
+    _plot_channel(axs[2], pyramid, 'Force_south CH=3', width)
+    _plot_channel(axs[2], pyramid, 'Force_north CH=4', width)
+    _plot_channel(axs[2], pyramid, 'TR_south CH=5', width)
+    _plot_channel(axs[2], pyramid, 'TR_north CH=6', width)
     axs[2].set_title('Individual sensors')
     axs[2].set_xlabel('Time [s]')
     axs[2].set_ylabel('Force [kN]')
@@ -50,27 +107,39 @@ def plot_forces(pdf):
     plt.show()
 
 
-def plot_deformations(pdf):
+def plot_deformations(pdf, width=2000):
+    """
+    Plots the deformations against time and against the applied force.
+    The channels are drawn from a min / max pyramid (see ChannelPyramid),
+    with at most width buckets in the visible window.
+
+    Parameters
+    ----------
+    pdf : pandas DataFrame or ChannelPyramid - the results, see parse_spider_results
+    width : int - number of buckets drawn, about the width of the plot in pixels
+
+    """
 
+    pyramid = _pyramid(pdf)
     fig, axs = plt.subplots(2, 1, constrained_layout=True)
     fig.suptitle('Deformations vs. Time', fontsize = 16)
 
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='LVDT_ne CH=7', ax=axs[0], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='LVDT_nw CH=8', ax=axs[0], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='LVDT__me CH=11', ax=axs[0], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='LVDT__mw CH=12', ax=axs[0], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='LVDT__se CH=13', ax=axs[0], kind = 'line')
-    pdf.plot(x ='Time  1 - default sample rate CH=1', y='LVDT__sw CH=14', ax=axs[0], kind = 'line')
+    _plot_channel(axs[0], pyramid, 'LVDT_ne CH=7', width)
+    _plot_channel(axs[0], pyramid, 'LVDT_nw CH=8', width)
+    _plot_channel(axs[0], pyramid, 'LVDT__me CH=11', width)
+    _plot_channel(axs[0], pyramid, 'LVDT__mw CH=12', width)
+    _plot_channel(axs[0], pyramid, 'LVDT__se CH=13', width)
+    _plot_channel(axs[0], pyramid, 'LVDT__sw CH=14', width)
     axs[0].set_title('LVDT Response')
     axs[0].set_xlabel('Time [s]')
     axs[0].set_ylabel('Displacement [mm]')
 
-    pdf.plot(y='Total Applied Force', x='LVDT_ne CH=7', ax=axs[1], kind = 'line')
-    pdf.plot(y='Total Applied Force', x='LVDT_nw CH=8', ax=axs[1], kind = 'line')
-    pdf.plot(y='Total Applied Force', x='LVDT__me CH=11', ax=axs[1], kind = 'line')
-    pdf.plot(y='Total Applied Force', x='LVDT__mw CH=12', ax=axs[1], kind = 'line')
-    pdf.plot(y='Total Applied Force', x='LVDT__se CH=13', ax=axs[1], kind = 'line')
-    pdf.plot(y='Total Applied Force', x='LVDT__sw CH=14', ax=axs[1], kind = 'line')
+    _plot_pair(axs[1], pyramid, 'LVDT_ne CH=7', 'Total Applied Force', width)
+    _plot_pair(axs[1], pyramid, 'LVDT_nw CH=8', 'Total Applied Force', width)
+    _plot_pair(axs[1], pyramid, 'LVDT__me CH=11', 'Total Applied Force', width)
+    _plot_pair(axs[1], pyramid, 'LVDT__mw CH=12', 'Total Applied Force', width)
+    _plot_pair(axs[1], pyramid, 'LVDT__se CH=13', 'Total Applied Force', width)
+    _plot_pair(axs[1], pyramid, 'LVDT__sw CH=14', 'Total Applied Force', width)
     axs[1].set_title('Force - Displacement')
     axs[1].set_xlabel('Displacements [mm]')
     axs[1].set_ylabel('Total Applied Force [kN]')
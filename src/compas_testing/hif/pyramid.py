@@ -0,0 +1,218 @@
+import os
+
+import numpy as np
+
+from compas_testing.hif.in_out import parse_spider_results
+
+__author__ = 'Francesco Ranaudo'
+__copyright__ = 'Copyright 2020, BLOCK Research Group - ETH Zurich'
+__license__ = 'MIT License'
+__email__ = 'ranaudo@arch.ethz.ch'
+
+__all__ = ['ChannelPyramid',
+           'build_pyramid',
+           ]
+
+
+# ******************************************************************************
+#   Pyramid
+# ******************************************************************************
+
+class ChannelPyramid(object):
+    """
+    Min / max / mean summaries of the channels of an acquisition at power-of-two bucket sizes.
+    Level 0 holds the samples, every level merges pairs of buckets of the level below,
+    so a time window can be drawn from a few thousand buckets whatever the length of the acquisition.
+
+    Parameters
+    ----------
+    time : array (samples) - sorted sampling times
+    values : array (samples x channels) - the measurements
+    names : list of str - names of the channels
+    time_name : str - name of the time channel
+
+    """
+
+    def __init__(self, time, values, names, time_name='time'):
+        self.names = list(names)
+        self.time_name = time_name
+        self._columns = dict((name, i) for i, name in enumerate(self.names))
+        self.levels = [self._samples(time, values)]
+        while len(self.levels[-1]['start']) > 1:
+            self.levels.append(self._merge(self.levels[-1]))
+
+    @staticmethod
+    def _samples(time, values):
+        # level 0, every sample is a bucket
+        time = np.asarray(time, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(time), -1)
+        return {'start': time, 'stop': time, 'min': values, 'max': values, 'sum': values, 'count': np.ones(len(time))}
+
+    @staticmethod
+    def _merge(level):
+        if len(level['start']) % 2:
+            # the last bucket is paired with an empty copy of itself
+            level = dict((key, np.concatenate([value, value[-1:]])) for key, value in level.items())
+            level['sum'][-1] = 0.0
+            level['count'][-1] = 0.0
+        return {'start': level['start'][0::2],
+                'stop': level['stop'][1::2],
+                'min': np.fmin(level['min'][0::2], level['min'][1::2]),
+                'max': np.fmax(level['max'][0::2], level['max'][1::2]),
+                'sum': level['sum'][0::2] + level['sum'][1::2],
+                'count': level['count'][0::2] + level['count'][1::2],
+                }
+
+    @classmethod
+    def from_dataframe(cls, pd_data, time=None):
+        """
+        Builds the pyramid of all the columns of a table.
+
+        Parameters
+        ----------
+        pd_data : pandas DataFrame - the measurements, e.g. from parse_spider_results
+        time : str, optional - name of the time column, default the first column
+
+        Returns
+        -------
+        ChannelPyramid
+        """
+
+        time = pd_data.columns[0] if time is None else time
+        names = [name for name in pd_data.columns if name != time]
+        values = pd_data[names].to_numpy(dtype=np.float64, na_value=np.nan)
+        return cls(pd_data[time].to_numpy(dtype=np.float64), values, names, time)
+
+    def __len__(self):
+        return len(self.levels[0]['start'])
+
+    def save(self, filepath):
+        """
+        Saves the pyramid in a numpy .npz file.
+
+        Parameters
+        ----------
+        filepath : str
+        """
+
+        # level 0 is saved as the samples only
+        arrays = {'names': np.array(self.names), 'time_name': np.array(self.time_name),
+                  'time': self.levels[0]['start'], 'values': self.levels[0]['sum']}
+        for i, level in enumerate(self.levels[1:], 1):
+            for key, value in level.items():
+                arrays['{}_{}'.format(key, i)] = value
+        with open(filepath, 'wb') as fp:
+            np.savez(fp, **arrays)
+
+    @classmethod
+    def load(cls, filepath):
+        """
+        Loads a pyramid saved by ChannelPyramid.save.
+
+        Parameters
+        ----------
+        filepath : str
+
+        Returns
+        -------
+        ChannelPyramid
+        """
+
+        with np.load(filepath) as data:
+            pyramid = cls.__new__(cls)
+            pyramid.names = data['names'].tolist()
+            pyramid.time_name = str(data['time_name'])
+            pyramid._columns = dict((name, i) for i, name in enumerate(pyramid.names))
+            pyramid.levels = [cls._samples(data['time'], data['values'])]
+            while 'start_{}'.format(len(pyramid.levels)) in data:
+                i = len(pyramid.levels)
+                pyramid.levels.append(dict((key, data['{}_{}'.format(key, i)])
+                                           for key in ('start', 'stop', 'min', 'max', 'sum', 'count')))
+        return pyramid
+
+    def level_for(self, start=None, stop=None, width=1000):
+        """
+        Finds the finest level that has at most width buckets in a time window.
+
+        Parameters
+        ----------
+        start : float, optional - start of the window, default the first sample
+        stop : float, optional - end of the window, default the last sample
+        width : int - number of buckets wanted, e.g. the width of the plot in pixels
+
+        Returns
+        -------
+        int
+        """
+
+        time = self.levels[0]['start']
+        first = 0 if start is None else np.searchsorted(time, start, side='left')
+        last = len(time) if stop is None else np.searchsorted(time, stop, side='right')
+        samples = max(last - first, 1)
+        level = int(np.ceil(np.log2(samples / float(max(width, 1))))) if samples > width else 0
+        return min(level, len(self.levels) - 1)
+
+    def query(self, names, start=None, stop=None, width=1000):
+        """
+        Returns the summaries of some channels over a time window, at the resolution of the given width.
+
+        Parameters
+        ----------
+        names : str or list of str - names of the channels
+        start : float, optional - start of the window, default the first sample
+        stop : float, optional - end of the window, default the last sample
+        width : int - max number of buckets to return, e.g. the width of the plot in pixels
+
+        Returns
+        -------
+        time : array (buckets) - middle of each bucket
+        minimum : array (buckets x channels)
+        maximum : array (buckets x channels)
+        mean : array (buckets x channels)
+        """
+
+        columns = [self._columns[name] for name in ([names] if isinstance(names, str) else names)]
+        level = self.levels[self.level_for(start, stop, width)]
+        # the buckets overlapping the window
+        first = 0 if start is None else np.searchsorted(level['stop'], start, side='left')
+        last = len(level['start']) if stop is None else np.searchsorted(level['start'], stop, side='right')
+        window = slice(first, last)
+
+        count = level['count'][window]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = level['sum'][window][:, columns] / count[:, None]
+        time = 0.5 * (level['start'][window] + level['stop'][window])
+        return time, level['min'][window][:, columns], level['max'][window][:, columns], mean
+
+
+def build_pyramid(input_file, filepath=None):
+    """
+    Builds the pyramid of a catman export once: it is saved next to the export
+    and loaded from there as long as the export does not change.
+
+    Parameters
+    ----------
+    input_file : str - path of the .txt file exported by catman
+    filepath : str, optional - path of the pyramid file, default the export path with the .pyramid.npz extension
+
+    Returns
+    -------
+    ChannelPyramid
+    """
+
+    filepath = filepath or os.path.splitext(input_file)[0] + '.pyramid.npz'
+    if os.path.exists(filepath) and os.path.getmtime(filepath) >= os.path.getmtime(input_file):
+        return ChannelPyramid.load(filepath)
+
+    pd_data = parse_spider_results(input_file)[2]
+    pyramid = ChannelPyramid.from_dataframe(pd_data)
+    pyramid.save(filepath)
+    return pyramid
+
+
+# ******************************************************************************
+#   Main
+# ******************************************************************************
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from compas_testing.gom import follow_stages
+from compas_testing.gom import iter_stages
+
+
+def rows(stage, num_points=3):
+    # Index | Stage | Stage time | ID/Name | X | Y | Z | dX | dY | dZ | d
+    lines = []
+    for i in range(num_points):
+        x, y, z = 100.0 * i, 10.0 * stage, 0.5
+        line = '{} {} {} P{} {} {} {} 0.0 {} 0.0 {}\n'
+        lines.append(line.format(i, stage, 1.5 * stage, i, x, y, z, 10.0 * stage, 10.0 * stage))
+    return ''.join(lines)
+
+
+def append(path, text):
+    with open(str(path), 'a') as fp:
+        fp.write(text)
+
+
+def follow(path, checkpoint=None):
+    return follow_stages(str(path), checkpoint=checkpoint, interval=0.01, timeout=0.05)
+
+
+def test_follow_stages_matches_iter_stages(tmp_path):
+    path = tmp_path / 'export.txt'
+    append(path, ''.join(rows(s) for s in range(4)))
+    assert list(follow(path)) == list(iter_stages(str(path)))
+
+
+def test_follow_stages_timeout_flushes_last_stage(tmp_path):
+    path = tmp_path / 'export.txt'
+    append(path, rows(0) + rows(1))
+    stages = list(follow(path))
+    assert [s[0] for s in stages] == [0, 1]
+    assert len(stages[1][2]) == 3
+
+
+def test_follow_stages_growing_file(tmp_path):
+    path = tmp_path / 'export.txt'
+    text = rows(0) + rows(1)
+    cut = text.index('\n', len(rows(0))) + 5
+    # the first row of stage 1 is complete, the second one is cut in the middle
+    append(path, text[:cut])
+    stages = follow(path)
+    assert next(stages)[0] == 0
+    append(path, text[cut:] + rows(2))
+    stage, time, cloud = next(stages)
+    assert (stage, time) == (1, 1.5)
+    assert cloud == [(100.0 * i, 10.0, 0.5) for i in range(3)]
+    assert [s[0] for s in stages] == [2]
+
+
+def test_follow_stages_resumes_from_checkpoint(tmp_path):
+    path = tmp_path / 'export.txt'
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    # stage 2 is still being written when the reader stops
+    append(path, rows(0) + rows(1) + rows(2, num_points=2))
+    stages = list(follow(path, checkpoint))
+    assert [s[0] for s in stages] == [0, 1, 2]
+    assert len(stages[2][2]) == 2
+
+    # the checkpoint points at the first row of stage 2, which was only flushed by the timeout
+    with open(checkpoint, 'r') as fp:
+        offset = json.load(fp)['offset']
+    assert offset == len(rows(0) + rows(1))
+
+    append(path, rows(2)[len(rows(2, num_points=2)):] + rows(3))
+    stages = list(follow(path, checkpoint))
+    assert [s[0] for s in stages] == [2, 3]
+    assert len(stages[0][2]) == 3
+    assert stages == list(iter_stages(str(path)))[2:]
+
+
+def test_follow_stages_checkpoint_of_another_export(tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    for name in ('first.txt', 'second.txt'):
+        append(tmp_path / name, rows(0) + rows(1))
+    list(follow(tmp_path / 'first.txt', checkpoint))
+    with pytest.raises(ValueError):
+        list(follow(tmp_path / 'second.txt', checkpoint))
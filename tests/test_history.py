@@ -0,0 +1,184 @@
+import os
+import gzip
+
+import numpy as np
+import pytest
+
+from compas_testing.gom import PointsHistory
+from compas_testing.gom import PointsHistoryView
+from compas_testing.gom import StageMatches
+from compas_testing.gom import find_corrupted_points
+from compas_testing.gom import find_corrupted_stages
+from compas_testing.gom import find_points_between_stages
+from compas_testing.gom import history_to_json
+from compas_testing.gom import remove_points_from_results
+from compas_testing.gom import split_results
+from compas_testing.gom.history import BLANK
+
+
+def make_dict(num_points=6, num_stages=9, seed=0):
+    # a points history dictionary as built by find_points_from_stage before PointsHistory, with blank points
+    rng = np.random.default_rng(seed)
+    reference = rng.uniform(-50.0, 50.0, (num_points, 3)).round(2)
+    points_history = {}
+    for p, ref in enumerate(reference.tolist()):
+        value = []
+        for s in range(num_stages):
+            if rng.random() < 0.2:
+                value.append(BLANK)
+                continue
+            xyz = tuple((np.asarray(ref) + rng.normal(0.0, 1.0, 3)).tolist())
+            value.append((float(np.linalg.norm(np.subtract(xyz, ref))), xyz, int(rng.integers(0, 500))))
+        points_history[str(tuple(ref))] = value
+    return points_history
+
+
+def coordinates_dict(points_history):
+    return dict((k, [tuple(e[1]) for e in v]) for k, v in points_history.items())
+
+
+def distances_dict(points_history):
+    return dict((k, [e[0] for e in v]) for k, v in points_history.items())
+
+
+@pytest.fixture
+def data():
+    points_history = make_dict()
+    return points_history, PointsHistory.from_dict(points_history)
+
+
+def test_mapping(data):
+    points_history, history = data
+    assert len(history) == len(points_history)
+    assert list(history) == list(points_history)
+    assert list(history.keys()) == list(points_history.keys())
+    assert dict(history.items()) == points_history
+    assert history == points_history
+    for key, value in points_history.items():
+        assert key in history
+        assert history[key] == value
+        assert history.get(key) == value
+    assert 'missing' not in history
+    assert history.get('missing') is None
+    with pytest.raises(KeyError):
+        history['missing']
+
+
+def test_conversions(data):
+    points_history, history = data
+    assert history.to_dict() == points_history
+    assert history.to_coordinates_dict() == coordinates_dict(points_history)
+    assert history.to_distances_dict() == distances_dict(points_history)
+
+
+def test_from_coordinates(data):
+    points_history, history = data
+    loaded = PointsHistory.from_coordinates(coordinates_dict(points_history), distances_dict(points_history))
+    assert np.array_equal(loaded.mask, history.mask)
+    assert loaded.to_coordinates_dict() == coordinates_dict(points_history)
+    assert loaded.to_distances_dict() == distances_dict(points_history)
+
+
+def test_point_at_origin_is_not_missing():
+    history = PointsHistory([[1.0, 0.0, 0.0]], [[[0.0, 0.0, 0.0], [np.nan, np.nan, np.nan]]])
+    assert history.mask.tolist() == [[True, False]]
+    assert history['(1.0, 0.0, 0.0)'] == [(1.0, (0.0, 0.0, 0.0), -1), BLANK]
+
+
+def test_select_and_remove(data):
+    points_history, history = data
+    keys = list(points_history)
+    removed = [keys[1], keys[4]]
+    expected = dict((k, v) for k, v in points_history.items() if k not in removed)
+    assert history.remove_points(removed).to_dict() == expected
+    assert history.select_points([keys[0], keys[2]]).to_dict() == dict((k, points_history[k]) for k in keys[0:3:2])
+    assert history.select_stages(2, 5).to_dict() == dict((k, v[2:5]) for k, v in points_history.items())
+
+
+def test_views_of_views(data):
+    points_history, history = data
+    keys = list(points_history)
+    view = history.view_points([0, 2, 3, 5]).view_stages(1, 8).view_points([True, False, True, True])
+    view = view.view_stages(2, None)
+    assert isinstance(view, PointsHistoryView)
+    assert view.base is history
+    expected = dict((keys[i], points_history[keys[i]][3:8]) for i in (0, 3, 5))
+    assert view.to_dict() == expected
+    assert dict(view.items()) == expected
+    assert (view.num_points, view.num_stages) == (3, 5)
+    assert np.array_equal(view.coordinates, history.coordinates[[0, 3, 5], 3:8], equal_nan=True)
+    assert view.to_distances_dict() == distances_dict(expected)
+
+
+def test_remove_points_from_results(data):
+    points_history, history = data
+    removed = find_corrupted_points(coordinates_dict(points_history))
+    expected = remove_points_from_results(removed, points_history)
+    view = remove_points_from_results(removed, history)
+    assert isinstance(view, PointsHistoryView)
+    assert view.to_dict() == expected
+    # the inputs are not modified
+    assert history.to_dict() == points_history
+    assert len(points_history) == 6
+
+
+def test_split_results(data):
+    points_history, history = data
+    chunks = {'c0': [0, 4], 'c1': [5, 9]}
+    expected = split_results(points_history, chunks)
+    cycles = split_results(history, chunks)
+    assert list(cycles) == list(expected)
+    for name in chunks:
+        assert cycles[name].to_dict() == expected[name]
+
+
+def test_corruption(data):
+    points_history, history = data
+    coordinates = coordinates_dict(points_history)
+    assert find_corrupted_stages(history) == find_corrupted_stages(coordinates)
+    assert find_corrupted_points(history) == find_corrupted_points(coordinates)
+
+
+def read(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as fp:
+        return fp.read()
+
+
+@pytest.mark.parametrize('options', [{}, {'compact': True}, {'compress': True}, {'precision': 3}])
+def test_history_to_json_identical(tmp_path, data, options):
+    points_history, history = data
+    names = ['complete', 'coordinates', 'distances']
+    for folder, source in (('dict', points_history), ('history', history), ('view', history.view_stages(0, None))):
+        os.mkdir(str(tmp_path / folder))
+        history_to_json(source, str(tmp_path / folder), names, from_gom=True, **options)
+    extension = '.json.gz' if options.get('compress') else '.json'
+    for name in names:
+        expected = read(str(tmp_path / 'dict' / ('points_history_' + name + extension)))
+        assert read(str(tmp_path / 'history' / ('points_history_' + name + extension))) == expected
+        assert read(str(tmp_path / 'view' / ('points_history_' + name + extension))) == expected
+
+
+def test_history_to_json_names(tmp_path, data):
+    points_history, history = data
+    with pytest.raises(ValueError):
+        history_to_json(history, str(tmp_path), ['coordinates'])
+    with pytest.raises(ValueError):
+        history_to_json(points_history, str(tmp_path), ['complete'], from_gom=True, compact=True)
+    assert os.listdir(str(tmp_path)) == []
+    history_to_json(coordinates_dict(points_history), str(tmp_path), ['coordinates'])
+    assert os.listdir(str(tmp_path)) == ['points_history_coordinates.json']
+
+
+def test_find_points_between_stages():
+    clouds = {0: [(0.0, 0.0, 0.0), (10.0, 0.0, 0.0), (100.0, 0.0, 0.0)],
+              1: [(1.0, 0.0, 0.0), (11.0, 0.0, 0.0)],
+              2: [(1.0, 2.0, 0.0), (11.0, 2.0, 0.0)]}
+    matches = find_points_between_stages(clouds, 3, tolerance=5)
+    assert len(matches) == 2
+    assert all(isinstance(m, StageMatches) for m in matches)
+    assert list(matches[0]) == [(1.0, (1.0, 0.0, 0.0), 0), (1.0, (11.0, 0.0, 0.0), 1), BLANK]
+    assert matches[0][-1] == BLANK
+    assert matches[0][:2] == list(matches[0])[:2]
+    assert matches[1].mask.tolist() == [True, True]
+    assert matches[1].indices.tolist() == [0, 1]
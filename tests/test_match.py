@@ -0,0 +1,147 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from compas_testing.gom import group_per_gkey
+from compas_testing.gom.match import SpatialHash
+from compas_testing.gom.match import assign_points_in_cloud
+from compas_testing.gom.match import closest_points_in_cloud
+from compas_testing.gom.match import closest_points_in_clouds
+
+
+def brute_force_assignment(points, cloud, tolerance):
+    # the matchings with the most pairs within the tolerance, then the smallest total distance
+    d = np.linalg.norm(points[:, None, :] - cloud[None, :, :], axis=2)
+    best = (0, 0.0)
+    choices = [[None] + [j for j in range(len(cloud)) if d[i, j] <= tolerance] for i in range(len(points))]
+    for assignment in itertools.product(*choices):
+        matched = [(i, j) for i, j in enumerate(assignment) if j is not None]
+        if len(set(j for _, j in matched)) < len(matched):
+            continue
+        total = sum(d[i, j] for i, j in matched)
+        if len(matched) > best[0] or (len(matched) == best[0] and total < best[1]):
+            best = (len(matched), total)
+    return best
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_assign_points_in_cloud_is_optimal(seed):
+    # dense markers: the spacing is smaller than the tolerance, all the points compete for the same cloud points
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0.0, 30.0, (rng.integers(2, 7), 3))
+    cloud = rng.uniform(0.0, 30.0, (rng.integers(2, 7), 3))
+    tolerance = 20.0
+    distances, indices = assign_points_in_cloud(points, cloud, tolerance)
+
+    found = np.isfinite(distances)
+    assert len(set(indices[found].tolist())) == found.sum()
+    assert np.all(indices[~found] == len(cloud))
+    assert np.allclose(distances[found], np.linalg.norm(points[found] - cloud[indices[found]], axis=1))
+    assert np.all(distances[found] <= tolerance)
+
+    count, total = brute_force_assignment(points, cloud, tolerance)
+    assert found.sum() == count
+    assert distances[found].sum() == pytest.approx(total)
+
+
+def test_assign_points_in_cloud_dense_grid():
+    # a grid with a spacing of 30 and a tolerance of 50 forms a single group of candidates
+    grid = np.stack(np.meshgrid(np.arange(40), np.arange(40)), axis=-1).reshape(-1, 2) * 30.0
+    points = np.c_[grid, np.zeros(len(grid))]
+    cloud = points[::-1] + np.random.default_rng(0).normal(0.0, 3.0, points.shape)
+    distances, indices = assign_points_in_cloud(points, cloud, 50)
+    assert np.array_equal(indices, np.arange(len(points))[::-1])
+    assert np.allclose(distances, np.linalg.norm(points - cloud[indices], axis=1))
+
+
+def test_assign_points_in_cloud_coincident_points():
+    points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    distances, indices = assign_points_in_cloud(points, points[::-1], 5)
+    assert indices.tolist() == [1, 0]
+    assert distances.tolist() == [0.0, 0.0]
+
+
+def test_assign_points_in_cloud_no_candidates():
+    distances, indices = assign_points_in_cloud([[0.0, 0.0, 0.0]], [[100.0, 0.0, 0.0]], 5)
+    assert distances.tolist() == [np.inf]
+    assert indices.tolist() == [1]
+
+
+@pytest.mark.parametrize('tolerance', [None, 5.0])
+def test_closest_points_in_clouds_shared_memory(tolerance):
+    rng = np.random.default_rng(1)
+    reference = rng.uniform(0.0, 100.0, (50, 3))
+    clouds = [reference + rng.normal(0.0, 1.0, reference.shape) for _ in range(4)]
+    # the reference is shared by all the tasks and stored once
+    points = [reference] * 3 + [clouds[0]]
+    matches = closest_points_in_clouds(points, clouds, workers=2, tolerance=tolerance)
+    if tolerance is None:
+        expected = [closest_points_in_cloud(p, c) for p, c in zip(points, clouds)]
+    else:
+        expected = [assign_points_in_cloud(p, c, tolerance) for p, c in zip(points, clouds)]
+    for (d, i), (d_expected, i_expected) in zip(matches, expected):
+        assert np.array_equal(d, d_expected)
+        assert np.array_equal(i, i_expected)
+
+
+def brute_force_group(points, radius):
+    # single pass: each point joins the closest representative point within the radius, or becomes one
+    representatives = []
+    labels = []
+    for point in points:
+        d = [np.linalg.norm(np.subtract(point, r)) for r in representatives]
+        if d and min(d) <= radius:
+            labels.append(int(np.argmin(d)))
+        else:
+            representatives.append(point)
+            labels.append(len(representatives) - 1)
+    return labels
+
+
+@pytest.mark.parametrize('points', [
+    # exactly at the radius, inside a cell and across a cell border (the cells are 100 wide)
+    [(0.0, 0.0, 0.0), (50.0, 0.0, 0.0), (100.0, 0.0, 0.0)],
+    [(75.0, 0.0, 0.0), (125.0, 0.0, 0.0), (125.0, 0.0, 0.0001)],
+    # negative coordinates, across the border at 0
+    [(-25.0, 0.0, 0.0), (25.0, 0.0, 0.0), (-25.0, -50.0, 0.0), (-25.0, -50.0001, 0.0)],
+    [(-100.0, -100.0, -100.0), (-100.0, -150.0, -100.0), (-99.9999, -100.0, -100.0)],
+    # across the corner of 8 cells
+    [(80.0, 80.0, 80.0), (108.0, 108.0, 108.0), (120.0, 80.0, 120.0), (80.0, 120.0, 80.0)],
+    [(-20.0, -20.0, -20.0), (8.0, 8.0, 8.0), (-20.0, 20.0, -20.0), (20.0, -20.0, 20.0)],
+])
+def test_spatial_hash_borders(points):
+    assert SpatialHash(50).group(points) == brute_force_group(points, 50)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_spatial_hash_random(seed):
+    rng = np.random.default_rng(seed)
+    # markers on a coarse grid with noise, across negative and positive cells
+    markers = rng.integers(-5, 5, (40, 3)) * 120.0
+    points = (markers[rng.integers(0, len(markers), 400)] + rng.uniform(-30.0, 30.0, (400, 3))).tolist()
+    points += rng.uniform(-600.0, 600.0, (100, 3)).tolist()
+    assert SpatialHash(50).group(points) == brute_force_group(points, 50)
+
+
+def test_spatial_hash_find():
+    grid = SpatialHash(10)
+    assert grid.find((0.0, 0.0, 0.0)) is None
+    assert grid.add((0.0, 0.0, 0.0)) == 0
+    assert grid.add((-15.0, 0.0, 0.0)) == 1
+    assert grid.find((-10.0, 0.0, 0.0)) == 1
+    assert grid.find((0.0, 10.0, 0.0)) == 0
+    assert grid.find((0.0, 10.0001, 0.0)) is None
+    assert len(grid) == 2
+
+
+def test_spatial_hash_out_of_range():
+    with pytest.raises(ValueError):
+        SpatialHash(1e-6).cell_keys([(1e6, 0.0, 0.0)])
+
+
+def test_group_per_gkey():
+    results = [[0.0, 0.0, 0.0, 0.0, 0.0, 'a'], [0.0, 0.0, 500.0, 0.0, 0.0, 'b'],
+               [1.0, 1.0, 499.0, 1.0, 0.0, 'b'], [1.0, 1.0, 2.0, -1.0, 0.0, 'a']]
+    assert group_per_gkey(results) == {0: [(0.0, 0.0, 0.0), (2.0, -1.0, 0.0)],
+                                       1: [(500.0, 0.0, 0.0), (499.0, 1.0, 0.0)]}
@@ -0,0 +1,72 @@
+import io
+import gzip
+import json
+
+import pytest
+
+from compas_testing.helpers import read_json
+from compas_testing.helpers.helpers import _iter_json_object
+
+
+DATA = {
+    "(1.0, 2.0, 3.0)": [0.123456789, -12345.6789, 1e-07, 0.0],
+    "(4.5, -6.25, 1000000.0)": [[1.5, 2.5, 3.5], [4.5, 5.5, 6.5], [0.0, 0.0, 0.0]],
+    "a \"quoted\" {key}": [True, False, None, "x, y: {z}"],
+    "last": [12345678901234567890, -1],
+}
+
+
+def write(path, text, compress=False):
+    opener = gzip.open if compress else open
+    with opener(str(path), 'wt') as fp:
+        fp.write(text)
+    return str(path)
+
+
+@pytest.mark.parametrize('indent', [None, 1])
+@pytest.mark.parametrize('chunk_size', range(1, 24))
+def test_iter_json_object_chunk_boundaries(indent, chunk_size):
+    # every chunk size splits the keys and the numbers at a different place
+    text = json.dumps(DATA, indent=indent)
+    pairs = list(_iter_json_object(io.StringIO(text), chunk_size=chunk_size))
+    assert pairs == list(DATA.items())
+
+
+def test_iter_json_object_number_at_end_of_chunk():
+    # 12 is a complete number at the end of the first chunk, but the value is 123
+    pairs = list(_iter_json_object(io.StringIO('{"a":12' + '3}'), chunk_size=7))
+    assert pairs == [("a", 123)]
+
+
+def test_iter_json_object_empty():
+    assert list(_iter_json_object(io.StringIO(' { \n } '))) == []
+
+
+@pytest.mark.parametrize('text', ['[1, 2]', '{"a" 1}', '{"a": 1 "b": 2}', '{"a": 12'])
+def test_iter_json_object_invalid(text):
+    with pytest.raises(ValueError):
+        list(_iter_json_object(io.StringIO(text), chunk_size=2))
+
+
+def test_read_json_keys_stops_early(tmp_path):
+    # the text after the last wanted key is never decoded
+    text = json.dumps({"a": [1, 2], "b": [3, 4]})[:-1] + ', "c": [5, not json'
+    path = write(tmp_path / 'data.json', text)
+    assert read_json(path, keys=['b', 'a']) == {"a": [1, 2], "b": [3, 4]}
+    with pytest.raises(ValueError):
+        read_json(path, keys=['a', 'c'])
+
+
+def test_read_json_keys_and_stages(tmp_path):
+    path = write(tmp_path / 'data.json', json.dumps(DATA))
+    data = read_json(path, keys=["(1.0, 2.0, 3.0)", "missing"], stages=[1, 3])
+    assert data == {"(1.0, 2.0, 3.0)": [-12345.6789, 1e-07]}
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_read_json_gz(tmp_path, compress):
+    name = 'data.json.gz' if compress else 'data.json'
+    path = write(tmp_path / name, json.dumps(DATA, indent=1), compress)
+    assert read_json(path) == DATA
+    assert read_json(path, keys=["last"]) == {"last": DATA["last"]}
+    assert read_json(path, stages=[0, 1]) == dict((key, value[0:1]) for key, value in DATA.items())
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from compas_testing.gom import HistoryContainer
+from compas_testing.gom import PointsHistory
+from compas_testing.gom import history_to_container
+from compas_testing.gom import history_from_parquet
+from compas_testing.gom import history_to_parquet
+
+
+def make_history(num_points=7, num_stages=10, seed=0):
+    rng = np.random.default_rng(seed)
+    reference = rng.uniform(-100.0, 100.0, (num_points, 3)).round(3)
+    coordinates = reference[:, None, :] + rng.normal(0.0, 1.0, (num_points, num_stages, 3))
+    mask = rng.random((num_points, num_stages)) > 0.2
+    coordinates[~mask] = np.nan
+    indices = np.where(mask, rng.integers(0, 1000, mask.shape), -1).astype(np.int32)
+    return PointsHistory(reference, coordinates, None, mask, indices)
+
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    history = make_history()
+    filepath = str(tmp_path / 'history.parquet')
+    history_to_parquet(history, filepath, times=np.arange(history.num_stages) * 0.5, stages_per_group=3,
+                       metadata={'test': 'cube'})
+
+    loaded, metadata = history_from_parquet(filepath)
+    assert metadata == {'test': 'cube'}
+    assert loaded.point_keys == history.point_keys
+    assert np.array_equal(loaded.indices, history.indices)
+    assert np.array_equal(loaded.mask, history.mask)
+    assert loaded.to_dict() == history.to_dict()
+
+
+def test_parquet_round_trip_selection(tmp_path):
+    pytest.importorskip('pyarrow')
+    history = make_history()
+    filepath = str(tmp_path / 'history.parquet')
+    history_to_parquet(history, filepath, stages_per_group=4)
+
+    loaded, _ = history_from_parquet(filepath, stages=[3, 6], points=[1, 4])
+    assert loaded.to_dict() == history.select_points([1, 4]).select_stages(3, 6).to_dict()
+
+
+@pytest.fixture
+def container(tmp_path):
+    history = make_history(num_stages=23)
+    filepath = str(tmp_path / 'history.zip')
+    colors = np.arange(history.num_points * history.num_stages * 3).reshape(history.num_points, -1, 3)
+    history_to_container(history, filepath, cycles={'c0': [0, 10], 'c1': [12, 23]}, datasets={'colors': colors},
+                         chunk_stages=5)
+    with HistoryContainer(filepath) as container:
+        yield history, colors, container
+
+
+@pytest.mark.parametrize('start, stop', [(None, None), (0, 5), (4, 6), (5, 10), (3, 17), (20, 23), (22, 40),
+                                         (-3, None), (-8, -2), (7, 7), (23, None), (6, 2)])
+def test_container_read_across_chunks(container, start, stop):
+    history, colors, container = container
+    assert np.array_equal(container.read('colors', start, stop), colors[:, start:stop])
+    assert np.array_equal(container.read('indices', start, stop), history.indices[:, start:stop])
+
+
+@pytest.mark.parametrize('cycle', ['c0', 'c1'])
+@pytest.mark.parametrize('start, stop', [(None, None), (0, 3), (2, 9), (-4, None), (8, 30)])
+def test_container_read_cycle(container, cycle, start, stop):
+    history, colors, container = container
+    offset, end = container.cycles[cycle]
+    assert np.array_equal(container.read('colors', start, stop, cycle), colors[:, offset:end][:, start:stop])
+
+
+@pytest.mark.parametrize('cycle, index', [(None, 0), (None, 4), (None, 5), (None, 22), (None, -1), (None, -23),
+                                          ('c0', 9), ('c1', 0), ('c1', -1), ('c1', -11)])
+def test_container_stage(container, cycle, index):
+    history, colors, container = container
+    offset, end = container.cycles[cycle] if cycle else (0, history.num_stages)
+    assert np.array_equal(container.stage(index, cycle, 'colors'), colors[:, offset:end][:, index])
+
+
+@pytest.mark.parametrize('cycle, index', [(None, 23), (None, -24), ('c0', 10), ('c1', 11), ('c1', -12)])
+def test_container_stage_out_of_range(container, cycle, index):
+    history, colors, container = container
+    with pytest.raises(IndexError):
+        container.stage(index, cycle)
+
+
+@pytest.mark.parametrize('cycle, start, stop', [(None, 24, None), (None, -24, None), (None, 0, -24), ('c1', 12, 13)])
+def test_container_read_out_of_range(container, cycle, start, stop):
+    history, colors, container = container
+    with pytest.raises(IndexError):
+        container.read('coordinates', start, stop, cycle)
+
+
+def test_container_history(container):
+    history, colors, container = container
+    assert container.history().to_dict() == history.to_dict()
+    assert container.history(cycle='c1').to_dict() == history.select_stages(12, 23).to_dict()
+
+
+def test_container_empty_history(tmp_path):
+    filepath = str(tmp_path / 'history.zip')
+    history_to_container(make_history(num_stages=0), filepath)
+    with HistoryContainer(filepath) as container:
+        assert container.read('coordinates').shape == (7, 0, 3)
+        assert len(container.history()) == 7